@@ -1,6 +1,8 @@
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
-import os
 import seaborn as sns
+from sinks import save_figure, save_bytes
 
 def binner_plot(amber, output_path):
 
@@ -9,7 +11,7 @@ def binner_plot(amber, output_path):
     sns.set_theme(style="whitegrid")
 
     # Create barplot
-    plt.figure(figsize=(12, 6))
+    fig = plt.figure(figsize=(12, 6))
     ax = sns.barplot(
         data=df,
         x='Tool',
@@ -26,4 +28,100 @@ def binner_plot(amber, output_path):
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout()
 
-    plt.savefig(os.path.join(output_path, "binner_compare.png"))
\ No newline at end of file
+    return save_figure(fig, output_path, "binner_compare.png")
+
+amber_metrics = {
+    "Precision": "precision_avg",
+    "Recall": "recall_avg",
+    "F1": "f1_score_per",
+    "ARI": "adjusted_rand_index",
+}
+amber_units = ["bp", "seq"]
+
+def amber_long(amber, binning_type="genome"):
+    """Tidy table (Sample, Tool, metric, unit, value) of the AMBER metrics"""
+    df = amber.reset_index() if "Sample" not in amber.columns else amber
+    df = df[df["binning type"] == binning_type]
+
+    frames = []
+    for metric, prefix in amber_metrics.items():
+        for unit in amber_units:
+            column = f"{prefix}_{unit}"
+            if column not in df.columns:
+                continue
+            frames.append(pd.DataFrame({
+                "Sample": df["Sample"].astype(str).values,
+                "Tool": df["Tool"].values,
+                "metric": metric,
+                "unit": unit,
+                "value": pd.to_numeric(df[column], errors="coerce").values,
+            }))
+    return pd.concat(frames, ignore_index=True)
+
+def metric_summary(long, n_boot=1000, seed=0, ci=95):
+    """
+    Mean, std, median and percentile bootstrap CI over samples for every
+    Tool x metric x unit in one pass. The samples are resampled once per
+    bootstrap round (paired across tools and metrics), so every round is a
+    row of multinomial sample weights and all means are one matrix product.
+    Missing values are left out of the weights.
+    """
+    values = long.pivot_table(index=["Tool", "metric", "unit"], columns="Sample",
+                              values="value", aggfunc="mean", dropna=False)
+    x = values.to_numpy(dtype=float)
+    present = ~np.isnan(x)
+    x = np.where(present, x, 0.0)
+
+    n_samples = x.shape[1]
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(n_samples, np.full(n_samples, 1 / n_samples), size=n_boot).astype(float)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        boot = (weights @ x.T) / (weights @ present.T)
+    alpha = (100 - ci) / 2
+
+    summary = pd.DataFrame({
+        "n_samples": present.sum(axis=1),
+        "mean": np.nanmean(np.where(present, x, np.nan), axis=1),
+        "std": np.nanstd(np.where(present, x, np.nan), axis=1),
+        "median": np.nanmedian(np.where(present, x, np.nan), axis=1),
+        "ci_low": np.nanpercentile(boot, alpha, axis=0),
+        "ci_high": np.nanpercentile(boot, 100 - alpha, axis=0),
+    }, index=values.index).reset_index()
+    summary["n_boot"] = n_boot
+    return summary
+
+def binner_metrics_plot(amber, output_path, binning_type="genome", n_boot=1000, seed=0):
+    """Mean of every AMBER metric per binner with bootstrap CIs, faceted by metric and bp/seq"""
+    summary = metric_summary(amber_long(amber, binning_type), n_boot, seed)
+    save_bytes(summary.to_csv(index=False).encode("utf-8"), output_path, "binner_metrics_summary.csv")
+
+    tools = sorted(summary["Tool"].unique())
+    metrics = [m for m in amber_metrics if m in set(summary["metric"])]
+    units = [u for u in amber_units if u in set(summary["unit"])]
+    colors = sns.color_palette("crest", len(tools))
+    positions = np.arange(len(tools))
+
+    fig, axes = plt.subplots(len(units), len(metrics), figsize=(4 * len(metrics), 0.3 * len(tools) * len(units) + 2),
+                             sharex=True, sharey=True, squeeze=False)
+    for row, unit in enumerate(units):
+        for col, metric in enumerate(metrics):
+            ax = axes[row, col]
+            cell = (summary[(summary["metric"] == metric) & (summary["unit"] == unit)]
+                    .set_index("Tool").reindex(tools))
+            error = np.vstack([cell["mean"] - cell["ci_low"], cell["ci_high"] - cell["mean"]])
+            ax.barh(positions, cell["mean"], xerr=np.clip(np.nan_to_num(error), 0, None), color=colors,
+                    error_kw={"elinewidth": 1, "capsize": 2})
+            ax.set_xlim(0, 1)
+            ax.grid(axis="x", alpha=0.3)
+            if row == 0:
+                ax.set_title(metric, fontsize=12, weight="bold")
+            if col == 0:
+                ax.set_ylabel(f"per {unit}", fontsize=12)
+    axes[0, 0].set_yticks(positions, tools)
+    axes[0, 0].invert_yaxis()
+
+    fig.suptitle(f"AMBER {binning_type} binning metrics (mean of {summary['n_samples'].max()} samples, 95% bootstrap CI)", fontsize=14)
+    plt.tight_layout(rect=(0, 0, 1, 0.97))
+
+    return save_figure(fig, output_path, "binner_metrics.png")
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# popcount of every possible byte, used when numpy has no bitwise_count (< 2.0)
+_POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def pack_rows(presence):
+    """Pack a boolean matrix row-wise into uint64 words (rows x ceil(cols/64))"""
+    presence = np.asarray(presence, dtype=bool)
+    packed = np.packbits(presence, axis=1)
+
+    # pad the byte axis to a whole number of 64 bit words
+    pad = (-packed.shape[1]) % 8
+    if pad:
+        packed = np.pad(packed, ((0, 0), (0, pad)))
+
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def bit_counts(words):
+    """Number of set bits of every uint64 word"""
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+
+    as_bytes = words.view(np.uint8).reshape(words.shape + (8,))
+    return _POPCOUNT_LUT[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+def popcount(words):
+    """Number of set bits in packed uint64 words, summed over the last axis"""
+    return bit_counts(words).sum(axis=-1, dtype=np.int64)
+
+def presence_matrix(coverm, present_threshold=0.0):
+    """MAG x sample detection matrix of a CoverM table (abundance > present_threshold)"""
+    cov = coverm.drop(index="unmapped", errors="ignore")
+    cov = cov.apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    return cov.to_numpy() > present_threshold, cov.index, cov.columns
+
+def pairwise_and_count(a, b):
+    """Pairwise popcount(a_i & b_j) of two packed matrices, one 64 bit word at a time"""
+    a = np.asarray(a, dtype=np.uint64)
+    b = np.ascontiguousarray(np.asarray(b, dtype=np.uint64).T)
+    counts = np.zeros((a.shape[0], b.shape[1]), dtype=np.int32)
+
+    for w in range(a.shape[1]):
+        counts += bit_counts(a[:, w, None] & b[None, w, :])
+
+    return counts
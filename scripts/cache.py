@@ -0,0 +1,102 @@
+import glob
+import hashlib
+import json
+import os
+import pandas as pd
+
+class TableCache:
+    """
+    Derived tables (DataFrames / Series) on disk as parquet, keyed by a hash of the
+    input columns they were computed from and their parameters. Hits refresh the
+    file mtime and the least recently used entries are deleted above max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=512 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, name, inputs, params):
+        digest = hashlib.sha256(name.encode("utf-8"))
+        for table in inputs:
+            frame = table.to_frame() if isinstance(table, pd.Series) else table
+            digest.update(repr([(str(c), str(t)) for c, t in frame.dtypes.items()]).encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+        return f"{name}-{digest.hexdigest()[:24]}"
+
+    def get_or_compute(self, name, inputs, params, compute):
+        """Tables stored for (name, inputs, params), or compute() them and store them"""
+        key = self.key(name, inputs, params)
+        files = sorted(glob.glob(os.path.join(self.path, f"{key}.*.parquet")))
+        if files:
+            try:
+                tables = tuple(_from_parquet(f) for f in files)
+            except (OSError, ValueError):
+                tables = None
+            if tables is not None:
+                self.hits += 1
+                for f in files:
+                    os.utime(f)
+                return tables if len(tables) > 1 else tables[0]
+
+        self.misses += 1
+        result = compute()
+        for i, table in enumerate(result if isinstance(result, tuple) else (result,)):
+            _to_parquet(table, os.path.join(self.path, f"{key}.{i}.parquet"))
+        self.evict()
+        return result
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits into max_bytes"""
+        entries = {}
+        for f in glob.glob(os.path.join(self.path, "*.parquet")):
+            stat = os.stat(f)
+            files, size, used = entries.get(f.rsplit(".", 2)[0], ([], 0, 0))
+            entries[f.rsplit(".", 2)[0]] = (files + [f], size + stat.st_size, max(used, stat.st_mtime))
+
+        total = sum(size for _, size, _ in entries.values())
+        for files, size, _ in sorted(entries.values(), key=lambda e: e[2]):
+            if total <= self.max_bytes:
+                break
+            for f in files:
+                os.remove(f)
+            total -= size
+
+    def stats(self):
+        calls = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / calls if calls else 0.0}
+
+def _to_parquet(table, file):
+    if isinstance(table, pd.Series):
+        # marker column so the Series (and its name) comes back as a Series
+        table = table.to_frame(name=f"__series__{table.name if table.name is not None else ''}")
+    table = table.copy()
+    table.columns = table.columns.astype(str)
+    table.to_parquet(file)
+
+def _from_parquet(file):
+    table = pd.read_parquet(file)
+    if len(table.columns) == 1 and table.columns[0].startswith("__series__"):
+        name = table.columns[0][len("__series__"):]
+        return table.iloc[:, 0].rename(name or None)
+    return table
+
+_active_cache = None
+
+def set_cache(cache):
+    """Cache used by cached(); None disables caching"""
+    global _active_cache
+    _active_cache = cache
+
+def get_cache():
+    return _active_cache
+
+def cached(name, inputs, params, compute):
+    """compute() through the active cache, or directly when no cache is set"""
+    if _active_cache is None:
+        return compute()
+    return _active_cache.get_or_compute(name, inputs, params, compute)
@@ -2,9 +2,10 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import matplotlib.ticker as mtick
 import matplotlib.gridspec as gridspec
+import matplotlib.colors as mcolors
 import math
 import numpy as np
-import os                               # Dateipfade
+from sinks import save_figure
 import pandas as pd                     # Tabellen
 import seaborn as sns                   # High-level Plots
 
@@ -18,6 +19,9 @@ prefix_map = {
     'species': 's',
 }
 
+# partial, medium-quality and high-quality MAGs
+quality_colors = ("#86cbd5", "#7f7f7f", "#b64a4a")
+
 def extract_rank(classification, rank):
         prefix = prefix_map.get(rank)
         try:
@@ -25,17 +29,20 @@ def extract_rank(classification, rank):
         except StopIteration:
             return None
 
-def completeness_contamination_plot(checkm: pd.DataFrame, output_path: str):
-    """Scatter Completeness vs Contamination with marginal histograms"""
-    # ---- Data ----
-    df = checkm.loc[:, ["Completeness", "Contamination"]].copy()
-    x = pd.to_numeric(df["Completeness"], errors="coerce")
-    y = pd.to_numeric(df["Contamination"], errors="coerce")
-    df = pd.DataFrame({"x": x, "y": y}).dropna()
+def mimag_tier(completeness, contamination):
+    """MIMAG quality tier per MAG: high (>90% / <5%), medium (>=50% / <10%) or low"""
+    completeness = pd.to_numeric(pd.Series(completeness), errors="coerce")
+    contamination = pd.to_numeric(pd.Series(contamination), errors="coerce")
 
-    col_low = "#86cbd5"
-    col_mq  = "#7f7f7f"
-    col_hq  = "#b64a4a"
+    tier = pd.Series("Low-quality", index=completeness.index)
+    tier[(completeness >= 50) & (contamination < 10)] = "Medium-quality"
+    tier[(completeness > 90) & (contamination < 5)] = "High-quality"
+    tier[completeness.isna() | contamination.isna()] = "Unknown"
+    return tier
+
+def quality_figure(xmin, xmax, ymax):
+    """Scatter axes with the quality thresholds and the two marginal histogram axes"""
+    col_low, col_mq, col_hq = quality_colors
 
     # ---- Layout ----
     fig = plt.figure(figsize=(9, 8), constrained_layout=True)
@@ -52,10 +59,6 @@ def completeness_contamination_plot(checkm: pd.DataFrame, output_path: str):
     ax_histy   = fig.add_subplot(gs[1, 1], sharey=ax_scatter)
 
     # ---- Limits / Grid ----
-    # xmin = max(40, int(np.floor(df["x"].min() / 5) * 5))
-    xmin = 40
-    xmax = 100
-    ymax = max(5.0, min(7.0, np.ceil(df["y"].quantile(0.995))))
     ax_scatter.set_xlim(xmin, xmax)
     ax_scatter.set_ylim(0, ymax)
     ax_scatter.grid(True, linestyle=":", linewidth=0.7, alpha=0.7)
@@ -64,32 +67,24 @@ def completeness_contamination_plot(checkm: pd.DataFrame, output_path: str):
     ax_scatter.axvline(90, linestyle="--", linewidth=1.2, color=col_hq, alpha=0.9)
     ax_scatter.axhline(5,  linestyle="--", linewidth=1.0, color="#bbbbbb", alpha=0.9)
 
-    # only visible points in scatter plot - needed for histogram
-    df_vis = df[(df["x"] >= xmin) & (df["x"] <= xmax) &
-                (df["y"] >= 0)    & (df["y"] <= ymax)].copy()
-    
-    # redefined categories based on df_vis
-    cat_low_vis = (df_vis["x"] < 70)
-    cat_mq_vis  = (df_vis["x"] >= 70) & (df_vis["x"] < 90)
-    cat_hq_vis  = (df_vis["x"] >= 90) & (df_vis["y"] <= 5)
+    return fig, ax_scatter, ax_histx, ax_histy
 
-    total_n = len(df_vis)
-    
-    ax_scatter.scatter(df_vis.loc[cat_low_vis, "x"], df_vis.loc[cat_low_vis, "y"], s=16, alpha=0.85, edgecolors="none", color=col_low)
-    ax_scatter.scatter(df_vis.loc[cat_mq_vis,  "x"], df_vis.loc[cat_mq_vis,  "y"],  s=16, alpha=0.85, edgecolors="none", color=col_mq)
-    ax_scatter.scatter(df_vis.loc[cat_hq_vis,  "x"], df_vis.loc[cat_hq_vis,  "y"],  s=18, alpha=0.95, edgecolors="none", color=col_hq)
+def quality_legend(ax_scatter):
+    col_low, col_mq, col_hq = quality_colors
+    ax_scatter.legend(
+        handles=[mpatches.Patch(color=col_low, label="Partial MAGs"),
+                 mpatches.Patch(color=col_mq,  label="Medium-quality MAGs"),
+                 mpatches.Patch(color=col_hq,  label="High-quality MAGs")],
+        loc="upper center", bbox_to_anchor=(0.5, -0.12), ncol=3, frameon=False
+    )
+
+def quality_marginals(ax_histx, ax_histy, bins_x, bins_y, x_counts, y_counts, total_n):
+    """Stacked percentage histograms (partial, medium, high quality) above and right of the scatter"""
+    col_low, col_mq, col_hq = quality_colors
 
     # ---- Histogram Completeness ----
-    bins_x = np.arange(xmin, xmax + 1, 1)
     bin_centers_x = (bins_x[:-1] + bins_x[1:]) / 2
-
-    cnt_low, _ = np.histogram(df_vis.loc[cat_low_vis, "x"], bins=bins_x)
-    cnt_mq,  _ = np.histogram(df_vis.loc[cat_mq_vis,  "x"], bins=bins_x)
-    cnt_hq,  _ = np.histogram(df_vis.loc[cat_hq_vis,  "x"], bins=bins_x)
-
-    p_low = cnt_low / total_n
-    p_mq  = cnt_mq  / total_n
-    p_hq  = cnt_hq  / total_n
+    p_low, p_mq, p_hq = (c / total_n for c in x_counts)
 
     # stacked bins
     ax_histx.bar(bin_centers_x, p_low, width=1.0, color=col_low, edgecolor="white", linewidth=0.5)
@@ -111,16 +106,8 @@ def completeness_contamination_plot(checkm: pd.DataFrame, output_path: str):
     ax_histx.yaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0, decimals=0))
 
     # ---- Histogram Contamination ----
-    bins_y = np.arange(0, ymax + 0.05, 0.1)
     bin_centers_y = (bins_y[:-1] + bins_y[1:]) / 2
-
-    cnt_low_y, _ = np.histogram(df_vis.loc[cat_low_vis, "y"], bins=bins_y)
-    cnt_mq_y,  _ = np.histogram(df_vis.loc[cat_mq_vis,  "y"], bins=bins_y)
-    cnt_hq_y,  _ = np.histogram(df_vis.loc[cat_hq_vis,  "y"], bins=bins_y)
-
-    p_low_y = cnt_low_y / total_n
-    p_mq_y  = cnt_mq_y  / total_n
-    p_hq_y  = cnt_hq_y  / total_n
+    p_low_y, p_mq_y, p_hq_y = (c / total_n for c in y_counts)
 
     # stacked horizontal bins
     ax_histy.barh(bin_centers_y, p_low_y, height=0.1, color=col_low, edgecolor="white", linewidth=0.5)
@@ -140,18 +127,84 @@ def completeness_contamination_plot(checkm: pd.DataFrame, output_path: str):
 
     ax_histy.xaxis.set_major_formatter(mtick.PercentFormatter(xmax=1.0, decimals=0))
 
-    from matplotlib.patches import Patch
-    ax_scatter.legend(
-        handles=[Patch(color=col_low, label="Partial MAGs"),
-                 Patch(color=col_mq,  label="Medium-quality MAGs"),
-                 Patch(color=col_hq,  label="High-quality MAGs")],
-        loc="upper center", bbox_to_anchor=(0.5, -0.12), ncol=3, frameon=False
-    )
+def completeness_contamination_plot(checkm: pd.DataFrame, output_path: str):
+    """Scatter Completeness vs Contamination with marginal histograms"""
+    # ---- Data ----
+    df = checkm.loc[:, ["Completeness", "Contamination"]].copy()
+    x = pd.to_numeric(df["Completeness"], errors="coerce")
+    y = pd.to_numeric(df["Contamination"], errors="coerce")
+    df = pd.DataFrame({"x": x, "y": y}).dropna()
 
-    out = os.path.join(output_path, "comp_conta_marginals.png")
-    fig.savefig(out, dpi=220)
-    print(f"[INFO] Saved: {out}")
+    col_low, col_mq, col_hq = quality_colors
 
+    # ---- Limits ----
+    # xmin = max(40, int(np.floor(df["x"].min() / 5) * 5))
+    xmin = 40
+    xmax = 100
+    ymax = max(5.0, min(7.0, np.ceil(df["y"].quantile(0.995))))
+    fig, ax_scatter, ax_histx, ax_histy = quality_figure(xmin, xmax, ymax)
+
+    # only visible points in scatter plot - needed for histogram
+    df_vis = df[(df["x"] >= xmin) & (df["x"] <= xmax) &
+                (df["y"] >= 0)    & (df["y"] <= ymax)].copy()
+    
+    # redefined categories based on df_vis
+    cat_low_vis = (df_vis["x"] < 70)
+    cat_mq_vis  = (df_vis["x"] >= 70) & (df_vis["x"] < 90)
+    cat_hq_vis  = (df_vis["x"] >= 90) & (df_vis["y"] <= 5)
+
+    total_n = len(df_vis)
+    
+    ax_scatter.scatter(df_vis.loc[cat_low_vis, "x"], df_vis.loc[cat_low_vis, "y"], s=16, alpha=0.85, edgecolors="none", color=col_low)
+    ax_scatter.scatter(df_vis.loc[cat_mq_vis,  "x"], df_vis.loc[cat_mq_vis,  "y"],  s=16, alpha=0.85, edgecolors="none", color=col_mq)
+    ax_scatter.scatter(df_vis.loc[cat_hq_vis,  "x"], df_vis.loc[cat_hq_vis,  "y"],  s=18, alpha=0.95, edgecolors="none", color=col_hq)
+
+    # ---- Marginal histograms ----
+    bins_x = np.arange(xmin, xmax + 1, 1)
+    bins_y = np.arange(0, ymax + 0.05, 0.1)
+    x_counts = [np.histogram(df_vis.loc[cat, "x"], bins=bins_x)[0] for cat in (cat_low_vis, cat_mq_vis, cat_hq_vis)]
+    y_counts = [np.histogram(df_vis.loc[cat, "y"], bins=bins_y)[0] for cat in (cat_low_vis, cat_mq_vis, cat_hq_vis)]
+    quality_marginals(ax_histx, ax_histy, bins_x, bins_y, x_counts, y_counts, total_n)
+
+    quality_legend(ax_scatter)
+
+    save_figure(fig, output_path, "comp_conta_marginals.png", dpi=220)
+    print("[INFO] Saved: comp_conta_marginals.png")
+    return fig
+
+def completeness_contamination_density_plot(histograms, x_edges, y_edges, ymax, output_path):
+    """
+    comp_conta_marginals from binned counts, e.g. from the streaming mode: the
+    scatter becomes a 2D histogram (opacity ~ log count). histograms holds the
+    counts of the partial, medium, high and remaining (>90%, >5%) MAGs on the
+    completeness x contamination grid.
+    """
+    xmin, xmax = x_edges[0], x_edges[-1]
+    fig, ax_scatter, ax_histx, ax_histy = quality_figure(xmin, xmax, ymax)
+
+    # only the contamination bins up to ymax are visible, like df_vis
+    bins_y = np.arange(0, ymax + 0.05, 0.1)
+    visible = [h[:, :len(bins_y) - 1] for h in histograms]
+    total_n = sum(h.sum() for h in visible)
+
+    top = max(h.max() for h in histograms[:3])
+    for h, color in zip(histograms[:3], quality_colors):
+        image = np.zeros(h.T.shape + (4,))
+        image[..., :3] = mcolors.to_rgb(color)
+        image[..., 3] = np.where(h.T > 0, 0.35 + 0.65 * np.log1p(h.T) / np.log1p(max(top, 1)), 0.0)
+        ax_scatter.imshow(image, extent=(xmin, xmax, y_edges[0], y_edges[-1]), origin="lower",
+                          aspect="auto", interpolation="nearest")
+    ax_scatter.set_ylim(0, ymax)
+
+    x_counts = [h.sum(axis=1) for h in visible[:3]]
+    y_counts = [h.sum(axis=0) for h in visible[:3]]
+    quality_marginals(ax_histx, ax_histy, x_edges, bins_y, x_counts, y_counts, total_n)
+
+    quality_legend(ax_scatter)
+
+    save_figure(fig, output_path, "comp_conta_marginals.png", dpi=220)
+    print("[INFO] Saved: comp_conta_marginals.png")
+    return fig
 
 def rank_completeness_contamination_plot(checkm, gtdb_bac, gtdb_ar, rank, output_path, n):
 
@@ -165,6 +218,11 @@ def rank_completeness_contamination_plot(checkm, gtdb_bac, gtdb_ar, rank, output
     # ---- Join GTDB phylum into CheckM based on index ----
     # hängt Rang-Spalte an die CheckM-Tabelle
     merged_df = checkm.join(gtdb_df[[f'{rank.capitalize()}']])
+    return plot_rank_completeness_contamination(merged_df, rank, output_path, n)
+
+def plot_rank_completeness_contamination(merged_df, rank, output_path, n, name="comp_conta_by_rank.png"):
+    """Completeness vs contamination scatter colored by the n most frequent taxa of the rank column"""
+    merged_df = merged_df.copy()
 
     # ---- Create a "Phylum (n)" column for labeling ----
     rank_counts = merged_df[f'{rank.capitalize()}'].value_counts()
@@ -184,7 +242,7 @@ def rank_completeness_contamination_plot(checkm, gtdb_bac, gtdb_ar, rank, output
 
     # ---- Plot: Completeness vs Contamination with counts in legend ----
     sns.set_theme(style="whitegrid")
-    plt.figure(figsize=(12, 6))
+    fig = plt.figure(figsize=(12, 6))
     sns.scatterplot(
         data=merged_df,
         y='Contamination',
@@ -201,4 +259,4 @@ def rank_completeness_contamination_plot(checkm, gtdb_bac, gtdb_ar, rank, output
     plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', title=f'{rank.capitalize()} (n)')
     plt.tight_layout()
 
-    plt.savefig(os.path.join(output_path, "comp_conta_by_rank.png"))
\ No newline at end of file
+    return save_figure(fig, output_path, name)
\ No newline at end of file
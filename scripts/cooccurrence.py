@@ -0,0 +1,137 @@
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import networkx as nx
+import io
+from sinks import save_figure, save_bytes
+from bitsets import pack_rows, popcount, pairwise_and_count
+from heatmap import normalize_id
+from comp_conta_plot import extract_rank
+
+def abundance_matrix(coverm, gtdb=None, rank=None):
+    """Feature x sample abundances, MAGs or (with rank) summed per GTDB taxon"""
+    cov = coverm.drop(index="unmapped", errors="ignore")
+    cov = cov.apply(pd.to_numeric, errors="coerce").fillna(0.0)
+
+    if gtdb is None or rank is None:
+        return cov
+
+    taxa = (pd.Series([normalize_id(str(g)) for g in cov.index], index=cov.index)
+            .map(gtdb["classification"])
+            .map(lambda x: extract_rank(x, rank) if isinstance(x, str) else None)
+            .replace("", f"Unknown {rank.capitalize()}"))
+
+    return cov.groupby(taxa).sum()
+
+def clr(abundance, pseudocount=1e-4):
+    """Centered log-ratio transform per sample (column)"""
+    log_ab = np.log(abundance + pseudocount)
+    return log_ab - log_ab.mean(axis=0, keepdims=True)
+
+def cooccurrence_edges(abundance, present_threshold=0.0, top_k=10, min_jaccard=0.3,
+                       min_codetected=2, max_block_pairs=2**22):
+    """
+    Sparse co-occurrence edge list of a feature x sample abundance table.
+    Co-detection counts come from packed presence bitsets (AND + popcount),
+    CLR correlations from dense products, both computed one block of rows at
+    a time so only block x features values are held in memory. Each node keeps
+    at most its top_k partners by Jaccard index above min_jaccard.
+    """
+    names = np.asarray(abundance.index)
+    values = abundance.to_numpy(dtype=np.float64)
+    n_features, n_samples = values.shape
+
+    packed = pack_rows(values > present_threshold)
+    n_detected = popcount(packed)
+
+    z = clr(values)
+    z = z - z.mean(axis=1, keepdims=True)
+    sd = z.std(axis=1, keepdims=True)
+    z = np.divide(z, sd, out=np.zeros_like(z), where=sd > 0).astype(np.float32)
+
+    block = max(1, max_block_pairs // max(1, n_features))
+    sources, targets, codetected, jaccard, correlation = [], [], [], [], []
+
+    for start in range(0, n_features, block):
+        stop = min(start + block, n_features)
+        rows = np.arange(start, stop)
+
+        co = pairwise_and_count(packed[start:stop], packed)
+        union = n_detected[start:stop, None] + n_detected[None, :] - co
+        jac = np.divide(co, union, out=np.zeros(co.shape, dtype=np.float32), where=union > 0)
+        jac[rows - start, rows] = 0.0
+
+        keep = (jac >= min_jaccard) & (co >= min_codetected)
+        if top_k is not None and top_k < n_features:
+            top = np.argpartition(-jac, top_k - 1, axis=1)[:, :top_k]
+            in_top = np.zeros_like(keep)
+            np.put_along_axis(in_top, top, True, axis=1)
+            keep &= in_top
+
+        corr = z[start:stop] @ z.T / n_samples
+        i, j = np.nonzero(keep)
+
+        sources.append(start + i)
+        targets.append(j)
+        codetected.append(co[i, j])
+        jaccard.append(jac[i, j])
+        correlation.append(corr[i, j])
+
+    src = np.concatenate(sources) if sources else np.empty(0, dtype=int)
+    tgt = np.concatenate(targets) if targets else np.empty(0, dtype=int)
+
+    edges = pd.DataFrame({
+        "source": np.minimum(src, tgt),
+        "target": np.maximum(src, tgt),
+        "codetected": np.concatenate(codetected) if codetected else [],
+        "jaccard": np.concatenate(jaccard) if jaccard else [],
+        "clr_correlation": np.concatenate(correlation) if correlation else [],
+    }).drop_duplicates(subset=["source", "target"])
+
+    edges["source"] = names[edges["source"].to_numpy()]
+    edges["target"] = names[edges["target"].to_numpy()]
+    nodes = pd.DataFrame({"detected_samples": n_detected}, index=names)
+
+    return edges.sort_values("jaccard", ascending=False, ignore_index=True), nodes
+
+def cooccurrence_network(coverm, output_path, gtdb=None, rank=None, present_threshold=0.0,
+                         top_k=10, min_jaccard=0.3, max_plot_edges=500):
+    """Co-occurrence edge list (Parquet + GraphML) and network figure of MAGs or taxa"""
+    abundance = abundance_matrix(coverm, gtdb, rank)
+    edges, nodes = cooccurrence_edges(abundance, present_threshold, top_k, min_jaccard)
+    print(f"[INFO] co-occurrence network: {len(nodes)} nodes, {len(edges)} edges")
+
+    save_bytes(edges.to_parquet(index=False), output_path, "cooccurrence_edges.parquet")
+
+    graph = nx.Graph()
+    for name, n_detected in nodes["detected_samples"].items():
+        graph.add_node(str(name), detected_samples=int(n_detected))
+    graph.add_weighted_edges_from(
+        zip(edges["source"].astype(str), edges["target"].astype(str), edges["jaccard"].astype(float))
+    )
+    for s, t, corr, co in edges[["source", "target", "clr_correlation", "codetected"]].itertuples(index=False):
+        graph.edges[str(s), str(t)].update(clr_correlation=float(corr), codetected=int(co))
+    graphml = io.BytesIO()
+    nx.write_graphml(graph, graphml)
+    save_bytes(graphml.getvalue(), output_path, "cooccurrence_network.graphml")
+
+    # ---- Figure: strongest edges only ----
+    plot_edges = edges.head(max_plot_edges)
+    sub = graph.edge_subgraph(zip(plot_edges["source"].astype(str), plot_edges["target"].astype(str)))
+
+    fig = plt.figure(figsize=(10, 10))
+    if sub.number_of_edges() > 0:
+        pos = nx.spring_layout(sub, seed=0, weight="weight")
+        widths = [1 + 3 * d["weight"] for _, _, d in sub.edges(data=True)]
+        colors = ["#b64a4a" if d["clr_correlation"] >= 0 else "#4a6fb6" for _, _, d in sub.edges(data=True)]
+        sizes = [10 + 5 * sub.nodes[n]["detected_samples"] for n in sub.nodes]
+
+        nx.draw_networkx_edges(sub, pos, width=widths, edge_color=colors, alpha=0.6)
+        nx.draw_networkx_nodes(sub, pos, node_size=sizes, node_color="#6b6b6b")
+        if sub.number_of_nodes() <= 50:
+            nx.draw_networkx_labels(sub, pos, font_size=7)
+
+    level = rank.capitalize() if rank is not None else "MAG"
+    plt.title(f"{level} co-occurrence network (top {len(plot_edges)} edges by Jaccard)")
+    plt.axis("off")
+    return save_figure(fig, output_path, "cooccurrence_network.png", dpi=200, bbox_inches="tight")
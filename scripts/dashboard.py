@@ -0,0 +1,478 @@
+import base64
+import gzip
+import json
+import numpy as np
+import pandas as pd
+from plotly.offline import get_plotlyjs
+from heatmap import normalize_id, clean_sample_label
+from comp_conta_plot import mimag_tier
+from amber_plots import amber_long
+from sinks import save_bytes
+
+ranks = ["domain", "phylum", "class", "order", "family", "genus", "species"]
+
+def dashboard_table(gtdb=None, checkm=None, checkm2=None, drep=None):
+    """
+    One row per MAG (normalized genome id) with taxonomy, quality tier and QC
+    metrics. Rows are the genomes of GTDB / CheckM; genomes only known to
+    CheckM2 or dRep (e.g. filtered before classification) are left out.
+    """
+    parts = []
+    mags = pd.Index([])
+
+    if gtdb is not None:
+        tax = gtdb["classification"].str.split(";", expand=True).reindex(columns=range(len(ranks)))
+        tax.columns = ranks
+        tax = tax.apply(lambda col: col.str.replace(r"^[a-z]__", "", regex=True).str.strip())
+        for rank in ranks:
+            tax[rank] = tax[rank].replace("", None).fillna(f"Unknown {rank.capitalize()}")
+        tax.index = [normalize_id(str(g)) for g in gtdb.index]
+        parts.append(tax)
+        mags = mags.union(tax.index)
+
+    if checkm is not None:
+        quality = checkm.loc[:, ["Completeness", "Contamination"]].apply(pd.to_numeric, errors="coerce")
+        quality.index = [normalize_id(str(g)) for g in checkm.index]
+        parts.append(quality)
+        mags = mags.union(quality.index)
+
+    if checkm2 is not None:
+        assembly = checkm2.loc[:, ["Contig_N50", "Total_Contigs", "Genome_Size", "Max_Contig_Length", "Coding_Density"]]
+        assembly = assembly.apply(pd.to_numeric, errors="coerce")
+        assembly.index = [normalize_id(str(g)) for g in checkm2.index]
+        parts.append(assembly)
+
+    if drep is not None:
+        clusters = drep.loc[:, ["secondary_cluster"]].astype(str)
+        clusters.index = [normalize_id(str(g)) for g in drep.index]
+        parts.append(clusters)
+
+    table = pd.concat([p[~p.index.duplicated()] for p in parts], axis=1)
+    if len(mags):
+        table = table[table.index.isin(mags)]
+    for rank in ranks:
+        if rank in table.columns:
+            table[rank] = table[rank].fillna("Unclassified")
+
+    if "Completeness" in table.columns:
+        table["quality_tier"] = mimag_tier(table["Completeness"], table["Contamination"])
+
+    return table
+
+def _b64(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+def encode_column(values: pd.Series):
+    """Numbers as float32 buffers, everything else dictionary encoded (int32 codes)"""
+    if pd.api.types.is_numeric_dtype(values):
+        return {"type": "f4", "data": _b64(values.to_numpy(dtype="<f4"))}
+    codes, uniques = pd.factorize(values)
+    return {"type": "dict", "dict": [str(u) for u in uniques], "data": _b64(codes.astype("<i4"))}
+
+def dashboard_payload(table, coverm=None, amber=None):
+    """gzip compressed, base64 encoded columnar payload shared by all dashboard views"""
+    payload = {
+        "n": int(len(table)),
+        "columns": {col: encode_column(table[col]) for col in table.columns},
+    }
+    payload["columns"]["genome"] = encode_column(pd.Series(table.index.astype(str)))
+
+    if coverm is not None:
+        cov = coverm.drop(index="unmapped", errors="ignore").apply(pd.to_numeric, errors="coerce").fillna(0.0)
+        rows = pd.Index(table.index).get_indexer([normalize_id(str(g)) for g in cov.index])
+        values = cov.to_numpy(dtype=np.float32)
+        mag, sample = np.nonzero((values > 0) & (rows[:, None] >= 0))
+
+        payload["abundance"] = {
+            "samples": [clean_sample_label(str(s)) for s in cov.columns],
+            "mag": _b64(rows[mag].astype("<i4")),
+            "sample": _b64(sample.astype("<i4")),
+            "value": _b64(values[mag, sample].astype("<f4")),
+        }
+
+    if amber is not None:
+        # binner means over samples, the per-MAG filters do not apply to them
+        means = amber_long(amber, "genome").groupby(["Tool", "metric", "unit"], sort=False)["value"].mean()
+        payload["amber"] = [[str(tool), metric, unit, None if np.isnan(v) else float(v)]
+                            for (tool, metric, unit), v in means.items()]
+
+    return base64.b64encode(gzip.compress(json.dumps(payload).encode("utf-8"), 9)).decode("ascii")
+
+def write_dashboard(output_path, gtdb=None, checkm=None, checkm2=None, drep=None, coverm=None, n=10, amber=None):
+    """Single self-contained HTML dashboard; plotly.js and the data are embedded once"""
+    table = dashboard_table(gtdb, checkm, checkm2, drep)
+    html = (dashboard_template
+            .replace("__PLOTLYJS__", get_plotlyjs())
+            .replace("__TOP_N__", str(n))
+            .replace("__PAYLOAD__", dashboard_payload(table, coverm, amber)))
+
+    data = save_bytes(html.encode("utf-8"), output_path, "dashboard.html")
+    print(f"[INFO] Saved: dashboard.html ({len(table)} MAGs, {len(data) / 1e6:.1f} MB)")
+    return data
+
+dashboard_template = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>MAGs-visualization dashboard</title>
+<script>__PLOTLYJS__</script>
+<style>
+  body { margin: 0; font-family: sans-serif; font-size: 13px; background: #fafafa; }
+  #controls { position: sticky; top: 0; z-index: 10; background: white; border-bottom: 1px solid #ccc;
+              padding: 8px 12px; display: flex; gap: 18px; align-items: center; flex-wrap: wrap; }
+  #grid { display: grid; grid-template-columns: 1fr 1fr; gap: 10px; padding: 10px; }
+  .view { background: white; border: 1px solid #ddd; min-height: 420px; }
+  .wide { grid-column: 1 / 3; }
+</style>
+</head>
+<body>
+<div id="controls">
+  <b>MAGs-visualization</b>
+  <label>Filter rank <select id="filterRank"></select></label>
+  <label>Taxon <select id="filterTaxon"></select></label>
+  <label>Group by <select id="groupRank"></select></label>
+  <span id="tiers"></span>
+  <span id="status">Loading…</span>
+</div>
+<div id="grid">
+  <div id="sankey" class="view wide"></div>
+  <div id="sankeyRank" class="view wide"></div>
+  <div id="pie" class="view"></div>
+  <div id="scatter" class="view"></div>
+  <div id="rankScatter" class="view wide"></div>
+  <div id="n50" class="view"></div>
+  <div id="contigs" class="view"></div>
+  <div id="genomeSize" class="view"></div>
+  <div id="longestContig" class="view"></div>
+  <div id="codingDensity" class="view"></div>
+  <div id="rarefaction" class="view"></div>
+  <div id="accumulation" class="view"></div>
+  <div id="amber" class="view"></div>
+  <div id="detection" class="view wide"></div>
+  <div id="heatmap" class="view wide"></div>
+</div>
+<script>
+const PAYLOAD = "__PAYLOAD__";
+const TOP_N = __TOP_N__;
+const RANKS = ["domain", "phylum", "class", "order", "family", "genus", "species"];
+const TIER_COLORS = {"High-quality": "#b64a4a", "Medium-quality": "#7f7f7f", "Low-quality": "#86cbd5", "Unknown": "#cccccc"};
+const cap = (s) => s.charAt(0).toUpperCase() + s.slice(1);
+let data;
+
+function bytes(b64) {
+  return Uint8Array.from(atob(b64), (c) => c.charCodeAt(0));
+}
+
+async function load() {
+  const stream = new Blob([bytes(PAYLOAD)]).stream().pipeThrough(new DecompressionStream("gzip"));
+  const raw = JSON.parse(await new Response(stream).text());
+  const columns = {};
+  for (const [name, col] of Object.entries(raw.columns)) {
+    const buffer = bytes(col.data).buffer;
+    columns[name] = col.type === "f4" ? {values: new Float32Array(buffer)}
+                                      : {codes: new Int32Array(buffer), dict: col.dict};
+  }
+  let abundance = null;
+  if (raw.abundance) {
+    abundance = {
+      samples: raw.abundance.samples,
+      mag: new Int32Array(bytes(raw.abundance.mag).buffer),
+      sample: new Int32Array(bytes(raw.abundance.sample).buffer),
+      value: new Float32Array(bytes(raw.abundance.value).buffer),
+    };
+  }
+  return {n: raw.n, columns, abundance, amber: raw.amber};
+}
+
+function label(column, i) {
+  const col = data.columns[column];
+  if (!col) return undefined;
+  return col.dict ? col.dict[col.codes[i]] : col.values[i];
+}
+
+function countBy(keys) {
+  const counts = new Map();
+  for (const k of keys) counts.set(k, (counts.get(k) || 0) + 1);
+  return [...counts.entries()].sort((a, b) => b[1] - a[1]);
+}
+
+function selection() {
+  const rank = document.getElementById("filterRank").value;
+  const taxon = document.getElementById("filterTaxon").value;
+  const tiers = new Set([...document.querySelectorAll("#tiers input:checked")].map((el) => el.value));
+  const selected = [];
+  for (let i = 0; i < data.n; i++) {
+    if (taxon !== "__all__" && label(rank, i) !== taxon) continue;
+    if (data.columns.quality_tier && !tiers.has(label("quality_tier", i))) continue;
+    selected.push(i);
+  }
+  return selected;
+}
+
+function drawSankey(rows) {
+  // top taxa per rank, the rest of each rank is merged into "Other"
+  const present = RANKS.filter((r) => data.columns[r]);
+  const keep = present.map((r) => new Set(countBy(rows.map((i) => label(r, i))).slice(0, 15).map(([k]) => k)));
+  const nodeKey = (d, i) => { const v = label(present[d], i); return keep[d].has(v) ? v : `Other ${cap(present[d])}`; };
+  const nodes = new Map(), links = new Map();
+  const node = (d, name) => {
+    const key = `${d}|${name}`;
+    if (!nodes.has(key)) nodes.set(key, {index: nodes.size, name, d});
+    return nodes.get(key).index;
+  };
+  for (const i of rows) {
+    for (let d = 0; d < present.length - 1; d++) {
+      const key = `${node(d, nodeKey(d, i))}>${node(d + 1, nodeKey(d + 1, i))}`;
+      links.set(key, (links.get(key) || 0) + 1);
+    }
+  }
+  const palette = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2"];
+  const nodeList = [...nodes.values()];
+  const linkList = [...links.entries()].map(([k, v]) => [...k.split(">").map(Number), v]);
+  Plotly.react("sankey", [{
+    type: "sankey",
+    node: {pad: 12, thickness: 16, label: nodeList.map((n) => n.name), color: nodeList.map((n) => palette[n.d])},
+    link: {source: linkList.map((l) => l[0]), target: linkList.map((l) => l[1]), value: linkList.map((l) => l[2])},
+  }], {title: "Taxonomic Classification Sankey", font: {size: 10}, height: 600});
+}
+
+function drawPie(rows, rank) {
+  const counts = countBy(rows.map((i) => label(rank, i))).slice(0, TOP_N);
+  Plotly.react("pie", [{type: "pie", labels: counts.map((c) => c[0]), values: counts.map((c) => c[1])}],
+               {title: `${cap(rank)}-level distribution of MAGs (top ${TOP_N})`});
+}
+
+function drawScatter(rows) {
+  if (!data.columns.Completeness) return;
+  const traces = Object.entries(TIER_COLORS).map(([tier, color]) => {
+    const sel = rows.filter((i) => label("quality_tier", i) === tier);
+    return {type: "scattergl", mode: "markers", name: tier, marker: {color, size: 6},
+            x: sel.map((i) => label("Completeness", i)), y: sel.map((i) => label("Contamination", i))};
+  });
+  Plotly.react("scatter", traces, {title: "Completeness vs Contamination",
+               xaxis: {title: "Completeness %"}, yaxis: {title: "Contamination %"}});
+}
+
+function drawHistogram(div, column, title, scale) {
+  return (rows) => {
+    if (!data.columns[column]) return;
+    const x = rows.map((i) => label(column, i) / scale).filter((v) => !Number.isNaN(v));
+    Plotly.react(div, [{type: "histogram", x, marker: {color: "skyblue", line: {color: "black", width: 1}}}],
+                 {title, xaxis: {title}, yaxis: {title: "Frequency"}});
+  };
+}
+
+function drawHeatmap(rows, rank) {
+  if (!data.abundance || !data.columns[rank]) return;
+  const ab = data.abundance, inSel = new Uint8Array(data.n);
+  for (const i of rows) inSel[i] = 1;
+  const sums = new Map();
+  for (let k = 0; k < ab.mag.length; k++) {
+    if (!inSel[ab.mag[k]]) continue;
+    const taxon = label(rank, ab.mag[k]);
+    if (!sums.has(taxon)) sums.set(taxon, new Float64Array(ab.samples.length));
+    sums.get(taxon)[ab.sample[k]] += ab.value[k];
+  }
+  const top = [...sums.entries()].sort((a, b) => b[1].reduce((s, v) => s + v, 0) - a[1].reduce((s, v) => s + v, 0)).slice(0, 30);
+  Plotly.react("heatmap", [{
+    type: "heatmap", x: top.map((t) => t[0]), y: ab.samples,
+    z: ab.samples.map((_, s) => top.map((t) => t[1][s])), colorscale: "Greens", colorbar: {title: "Rel. abundance (%)"},
+  }], {title: `Relative abundance: samples × ${rank} (top 30)`, height: Math.max(420, 18 * ab.samples.length)});
+}
+
+function drawRankSankey(rows, rank, maxGenomes = 300) {
+  // one band per MAG gets unreadable quickly, so only the first maxGenomes are linked
+  if (!data.columns[rank]) return;
+  const shown = rows.slice(0, maxGenomes);
+  const genomes = shown.map((i) => label("genome", i));
+  const taxa = [...new Set(shown.map((i) => label(rank, i)))];
+  const taxonIndex = new Map(taxa.map((t, k) => [t, genomes.length + k]));
+  Plotly.react("sankeyRank", [{
+    type: "sankey",
+    node: {pad: 6, thickness: 12, label: [...genomes, ...taxa],
+           color: [...genomes.map(() => "#7f7f7f"), ...taxa.map(() => "#ff7f0e")]},
+    link: {source: shown.map((_, k) => k), target: shown.map((i) => taxonIndex.get(label(rank, i))),
+           value: shown.map(() => 1)},
+  }], {title: `Genome → ${cap(rank)} Sankey` + (rows.length > maxGenomes ? ` (first ${maxGenomes} of ${rows.length} MAGs)` : ""),
+       font: {size: 9}, height: 600});
+}
+
+function drawRankScatter(rows, rank) {
+  if (!data.columns.Completeness || !data.columns[rank]) return;
+  const counts = countBy(rows.map((i) => label(rank, i)));
+  const top = new Set(counts.slice(0, TOP_N).map(([k]) => k));
+  const groups = new Map();
+  for (const i of rows) {
+    const taxon = label(rank, i);
+    const key = top.has(taxon) ? taxon : "Other";
+    if (!groups.has(key)) groups.set(key, []);
+    groups.get(key).push(i);
+  }
+  const traces = [...groups.entries()].map(([name, sel]) => ({
+    type: "scattergl", mode: "markers", name: `${name} (${sel.length})`, marker: {size: 6},
+    x: sel.map((i) => label("Completeness", i)), y: sel.map((i) => label("Contamination", i)),
+  }));
+  Plotly.react("rankScatter", traces, {title: `CheckM: Completeness vs Contamination (Colored by ${cap(rank)})`,
+               xaxis: {title: "Completeness (%)"}, yaxis: {title: "Contamination (%)"}});
+}
+
+function random(seed) {
+  // small seeded generator, the curves do not change between redraws
+  return () => {
+    seed = (seed + 0x6D2B79F5) | 0;
+    let t = Math.imul(seed ^ (seed >>> 15), 1 | seed);
+    t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t;
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+function shuffle(values, rand) {
+  const out = [...values];
+  for (let k = out.length - 1; k > 0; k--) {
+    const j = Math.floor(rand() * (k + 1));
+    [out[k], out[j]] = [out[j], out[k]];
+  }
+  return out;
+}
+
+function meanCurve(div, perms, steps, count, title, xTitle, yTitle) {
+  // mean ± 1 SD of count(order, prefix length) over random orders
+  const rand = random(1);
+  const sums = new Float64Array(steps.length), squares = new Float64Array(steps.length);
+  for (let p = 0; p < perms; p++) {
+    const values = count(rand);
+    values.forEach((v, k) => { sums[k] += v; squares[k] += v * v; });
+  }
+  const mean = [...sums].map((s) => s / perms);
+  const sd = mean.map((m, k) => Math.sqrt(Math.max(squares[k] / perms - m * m, 0)));
+  Plotly.react(div, [
+    {x: steps, y: mean.map((m, k) => m + sd[k]), mode: "lines", line: {width: 0}, showlegend: false},
+    {x: steps, y: mean.map((m, k) => m - sd[k]), mode: "lines", line: {width: 0}, fill: "tonexty",
+     fillcolor: "rgba(128,128,128,0.3)", name: "±1 SD"},
+    {x: steps, y: mean, mode: "lines", line: {color: "black"}, name: "Mean"},
+  ], {title, xaxis: {title: xTitle}, yaxis: {title: yTitle}});
+}
+
+function drawRarefaction(rows, perms = 20) {
+  if (!data.columns.secondary_cluster) return;
+  const clustered = rows.filter((i) => label("secondary_cluster", i) !== undefined);
+  if (!clustered.length) return;
+  const stride = Math.max(1, Math.ceil(clustered.length / 60));
+  const steps = [];
+  for (let d = stride; d <= clustered.length; d += stride) steps.push(d);
+  meanCurve("rarefaction", perms, steps, (rand) => {
+    const seen = new Set(), counts = [];
+    shuffle(clustered, rand).forEach((i, k) => {
+      seen.add(label("secondary_cluster", i));
+      if ((k + 1) % stride === 0) counts.push(seen.size);
+    });
+    return counts;
+  }, "Species-level Rarefaction Curve", "Number of genomes sampled", "Number of species clusters (>95% ANI)");
+}
+
+function presentPerSample(rows) {
+  const ab = data.abundance, inSel = new Uint8Array(data.n);
+  for (const i of rows) inSel[i] = 1;
+  const perSample = ab.samples.map(() => []);
+  for (let k = 0; k < ab.mag.length; k++) {
+    if (inSel[ab.mag[k]]) perSample[ab.sample[k]].push(ab.mag[k]);
+  }
+  return perSample;
+}
+
+function drawAccumulation(rows, perms = 20) {
+  if (!data.abundance) return;
+  const perSample = presentPerSample(rows);
+  const steps = perSample.map((_, k) => k + 1);
+  meanCurve("accumulation", perms, steps, (rand) => {
+    const seen = new Uint8Array(data.n);
+    let detected = 0;
+    return shuffle(perSample, rand).map((mags) => {
+      for (const m of mags) if (!seen[m]) { seen[m] = 1; detected++; }
+      return detected;
+    });
+  }, `MAG accumulation (${perms} permutations)`, "Number of samples", "Number of detected MAGs");
+}
+
+function drawDetection(rows, maxMags = 50) {
+  // MAGs detected in the most samples, present / absent per sample
+  if (!data.abundance) return;
+  const perSample = presentPerSample(rows);
+  const detected = new Map();
+  perSample.forEach((mags) => mags.forEach((m) => detected.set(m, (detected.get(m) || 0) + 1)));
+  const mags = [...detected.entries()].sort((a, b) => b[1] - a[1]).slice(0, maxMags).map(([m]) => m);
+  const sets = perSample.map((list) => new Set(list));
+  Plotly.react("detection", [{
+    type: "heatmap", x: mags.map((m) => label("genome", m)), y: data.abundance.samples,
+    z: sets.map((set) => mags.map((m) => (set.has(m) ? 1 : 0))),
+    colorscale: [[0, "#f0f0f0"], [1, "#2a7f62"]], showscale: false,
+  }], {title: `MAG detection in samples (top ${mags.length} MAGs)`,
+       height: Math.max(420, 18 * data.abundance.samples.length), xaxis: {showticklabels: false}});
+}
+
+function drawAmber() {
+  if (!data.amber) return;
+  const rows = data.amber.filter((r) => r[2] === "bp");
+  const tools = [...new Set(rows.map((r) => r[0]))];
+  const metrics = [...new Set(rows.map((r) => r[1]))];
+  Plotly.react("amber", metrics.map((metric) => ({
+    type: "bar", name: metric, x: tools,
+    y: tools.map((t) => (rows.find((r) => r[0] === t && r[1] === metric) || [])[3]),
+  })), {title: "AMBER binner metrics (genome binning, per bp, mean over samples)", barmode: "group",
+        yaxis: {range: [0, 1]}});
+}
+
+const views = [
+  drawSankey,
+  (rows) => drawRankSankey(rows, document.getElementById("groupRank").value),
+  (rows) => drawPie(rows, document.getElementById("groupRank").value),
+  drawScatter,
+  (rows) => drawRankScatter(rows, document.getElementById("groupRank").value),
+  drawHistogram("n50", "Contig_N50", "N50 (kbp)", 1000),
+  drawHistogram("contigs", "Total_Contigs", "Number of contigs per genome", 1),
+  drawHistogram("genomeSize", "Genome_Size", "Total length assembly (Mbp)", 1e6),
+  drawHistogram("longestContig", "Max_Contig_Length", "Longest contig (kbp)", 1000),
+  drawHistogram("codingDensity", "Coding_Density", "Coding density", 1),
+  drawRarefaction,
+  drawAccumulation,
+  drawAmber,
+  drawDetection,
+  (rows) => drawHeatmap(rows, document.getElementById("groupRank").value),
+];
+
+function update() {
+  const t0 = performance.now();
+  const rows = selection();
+  for (const view of views) view(rows);
+  document.getElementById("status").textContent =
+    `${rows.length} of ${data.n} MAGs (${Math.round(performance.now() - t0)} ms)`;
+}
+
+function fillTaxa() {
+  const rank = document.getElementById("filterRank").value;
+  const select = document.getElementById("filterTaxon");
+  const taxa = data.columns[rank] ? [...data.columns[rank].dict].sort() : [];
+  select.innerHTML = `<option value="__all__">All</option>`;
+  for (const t of taxa) select.add(new Option(t, t));
+}
+
+load().then((loaded) => {
+  data = loaded;
+  const present = RANKS.filter((r) => data.columns[r]);
+  for (const id of ["filterRank", "groupRank"]) {
+    document.getElementById(id).innerHTML = present.map((r) => `<option value="${r}">${cap(r)}</option>`).join("");
+  }
+  document.getElementById("groupRank").value = present.includes("phylum") ? "phylum" : present[0];
+  if (data.columns.quality_tier) {
+    document.getElementById("tiers").innerHTML = Object.keys(TIER_COLORS).map(
+      (t) => `<label><input type="checkbox" value="${t}" checked> ${t}</label>`).join(" ");
+  }
+  fillTaxa();
+  document.getElementById("filterRank").addEventListener("change", () => { fillTaxa(); update(); });
+  document.querySelectorAll("#filterTaxon, #groupRank, #tiers input").forEach((el) => el.addEventListener("change", update));
+  update();
+});
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from scipy import sparse
+from sinks import save_figure, save_bytes
+
+# dRep pairwise tables: (genome column 1, genome column 2, similarity column)
+pairwise_columns = {
+    "ndb": ("reference", "querry", "ani"),
+    "mdb": ("genome1", "genome2", "similarity"),
+}
+
+def read_pairwise_ani(path, genomes, kind="ndb", primary=None, chunk_size=1_000_000):
+    """
+    Stream a dRep Ndb.csv / Mdb.csv into a symmetric sparse genome x genome matrix.
+    Only the two genome columns and the similarity are parsed, genomes are mapped
+    to integer codes of `genomes` and values kept as float32. With `primary`
+    (primary cluster code per genome) only pairs inside one primary cluster are
+    kept, which bounds the memory for all-vs-all Mdb tables. A pair reported
+    in both directions gets the mean of its values.
+    """
+    first, second, value = pairwise_columns[kind]
+    n = len(genomes)
+    sums = sparse.csr_matrix((n, n), dtype=np.float64)
+    counts = sparse.csr_matrix((n, n), dtype=np.int32)
+    rows_read = 0
+
+    for chunk in pd.read_csv(path, usecols=[first, second, value], dtype={value: np.float32},
+                             chunksize=chunk_size):
+        rows_read += len(chunk)
+        a = genomes.get_indexer(chunk[first]).astype(np.int32)
+        b = genomes.get_indexer(chunk[second]).astype(np.int32)
+        keep = (a >= 0) & (b >= 0) & (a != b)
+        if primary is not None:
+            keep &= primary[np.maximum(a, 0)] == primary[np.maximum(b, 0)]
+
+        # upper triangle only, the matrix is mirrored at the end
+        a, b = np.minimum(a[keep], b[keep]), np.maximum(a[keep], b[keep])
+        values = chunk[value].to_numpy()[keep]
+        sums = sums + sparse.csr_matrix((values.astype(np.float64), (a, b)), shape=(n, n))
+        counts = counts + sparse.csr_matrix((np.ones(len(a), dtype=np.int32), (a, b)), shape=(n, n))
+
+    ani = sums.multiply(counts.astype(np.float64).power(-1)).astype(np.float32).tocsr()
+    print(f"[INFO] {path}: {rows_read} rows, {ani.nnz} genome pairs kept")
+    return ani + ani.T
+
+def cluster_codes(cdb):
+    """Genome index plus integer primary / secondary cluster codes (and names) from a dRep Cdb table"""
+    genomes = pd.Index(cdb.index.astype(str))
+    primary, primary_names = pd.factorize(cdb["primary_cluster"].astype(str))
+    secondary, secondary_names = pd.factorize(cdb["secondary_cluster"].astype(str))
+    return genomes, primary, primary_names, secondary, secondary_names
+
+def cluster_pairs(ani, primary, secondary):
+    """Every genome pair once (upper triangle) with its ANI and cluster relation"""
+    pairs = sparse.triu(ani, k=1).tocoo()
+    return pd.DataFrame({
+        "genome1": pairs.row,
+        "genome2": pairs.col,
+        "ani": pairs.data,
+        "primary_cluster": primary[pairs.row],
+        "same_secondary": secondary[pairs.row] == secondary[pairs.col],
+    })
+
+def within_cluster_ani_plot(pairs, secondary_names, secondary, output_path, threshold=0.95, n=10, bins=100):
+    """ANI of genome pairs within and between secondary clusters, plus the spread in the largest clusters"""
+    within = pairs[pairs["same_secondary"]]
+    between = pairs[~pairs["same_secondary"]]
+
+    summary = (within.assign(secondary_cluster=secondary_names[secondary[within["genome1"]]])
+               .groupby("secondary_cluster")["ani"]
+               .agg(pairs="size", min="min", mean="mean", median="median", max="max"))
+    summary.insert(0, "genomes", pd.Series(secondary_names[secondary]).value_counts().reindex(summary.index))
+    save_bytes(summary.to_csv().encode("utf-8"), output_path, "drep_ani_clusters.csv")
+
+    lowest = min(pairs["ani"].min(), threshold) if len(pairs) else threshold
+    edges = np.linspace(lowest, 1.0, bins + 1)
+
+    fig, (ax_hist, ax_box) = plt.subplots(1, 2, figsize=(14, 5))
+    ax_hist.hist(within["ani"], bins=edges, color="#48b07c", alpha=0.7, label="Same secondary cluster")
+    ax_hist.hist(between["ani"], bins=edges, color="#e0554a", alpha=0.7, label="Same primary, other secondary")
+    ax_hist.axvline(threshold, color="black", linestyle="--", label=f"Secondary threshold ({threshold:g})")
+    ax_hist.set_xlabel("ANI")
+    ax_hist.set_ylabel("Number of genome pairs")
+    ax_hist.set_yscale("log")
+    ax_hist.set_title("ANI within dRep clusters")
+    ax_hist.legend()
+
+    largest = summary.sort_values("pairs", ascending=False).head(n).index
+    groups = within.assign(secondary_cluster=secondary_names[secondary[within["genome1"]]])
+    groups = groups[groups["secondary_cluster"].isin(largest)].groupby("secondary_cluster")["ani"]
+    data = [groups.get_group(c).to_numpy() for c in largest]
+    if data:
+        ax_box.boxplot(data, vert=False, showfliers=False)
+        ax_box.set_yticks(np.arange(1, len(largest) + 1), largest)
+        ax_box.invert_yaxis()
+    ax_box.axvline(threshold, color="black", linestyle="--")
+    ax_box.set_xlabel("ANI")
+    ax_box.set_ylabel("Secondary cluster")
+    ax_box.set_title(f"Within-cluster ANI of the {len(data)} largest secondary clusters")
+
+    plt.tight_layout()
+    return save_figure(fig, output_path, "drep_within_cluster_ani.png")
+
+def primary_cluster_heatmap(ani, primary, primary_names, secondary, output_path, n=6, max_genomes=200):
+    """Dense ANI heatmaps of the n largest primary clusters, genomes ordered by secondary cluster"""
+    sizes = np.bincount(primary)
+    largest = np.argsort(sizes, kind="stable")[::-1][:n]
+    largest = largest[sizes[largest] > 1]
+
+    cols = min(3, max(len(largest), 1))
+    rows = max(int(np.ceil(len(largest) / cols)), 1)
+    fig, axes = plt.subplots(rows, cols, figsize=(5 * cols, 4.5 * rows), squeeze=False)
+
+    for ax, cluster in zip(axes.flat, largest):
+        members = np.flatnonzero(primary == cluster)
+        members = members[np.argsort(secondary[members], kind="stable")][:max_genomes]
+        # only the cluster's block of the sparse matrix is made dense
+        block = ani[members][:, members].toarray()
+        block[block == 0] = np.nan
+        np.fill_diagonal(block, 1.0)
+
+        image = ax.imshow(block, cmap="viridis", vmin=np.nanmin(block), vmax=1.0, interpolation="nearest")
+        ax.set_title(f"Primary cluster {primary_names[cluster]} ({sizes[cluster]} genomes)", fontsize=10)
+        ax.set_xticks([])
+        ax.set_yticks([])
+        boundaries = np.flatnonzero(np.diff(secondary[members])) + 0.5
+        for b in boundaries:
+            ax.axhline(b, color="white", linewidth=0.5)
+            ax.axvline(b, color="white", linewidth=0.5)
+        fig.colorbar(image, ax=ax, fraction=0.046, pad=0.04, label="ANI")
+
+    for ax in axes.flat[len(largest):]:
+        ax.axis("off")
+
+    fig.suptitle("Pairwise ANI per primary cluster (lines separate secondary clusters)")
+    plt.tight_layout()
+    return save_figure(fig, output_path, "drep_primary_cluster_ani.png")
+
+def drep_ani_plots(cdb, output_path, ndb_path=None, mdb_path=None, chunk_size=1_000_000, n=10):
+    """Within-cluster ANI distributions and per-primary-cluster heatmaps from Ndb (or Mdb)"""
+    genomes, primary, primary_names, secondary, secondary_names = cluster_codes(cdb)
+    if ndb_path is not None:
+        ani = read_pairwise_ani(ndb_path, genomes, "ndb", chunk_size=chunk_size)
+    else:
+        ani = read_pairwise_ani(mdb_path, genomes, "mdb", primary=primary, chunk_size=chunk_size)
+
+    pairs = cluster_pairs(ani, primary, secondary)
+    threshold = 1 - float(cdb["threshold"].iloc[0]) if "threshold" in cdb.columns else 0.95
+
+    return (within_cluster_ani_plot(pairs, secondary_names, secondary, output_path, threshold, n),
+            primary_cluster_heatmap(ani, primary, primary_names, secondary, output_path))
@@ -4,17 +4,40 @@ import matplotlib.pyplot as plt
 from matplotlib import gridspec
 from matplotlib.colors import ListedColormap, BoundaryNorm
 import seaborn as sns
-import os
-
-
-def extract_phylum(tax):
+from sinks import save_figure
+from cache import cached
+
+
+rank_prefix = {
+    "domain": "d",
+    "phylum": "p",
+    "class": "c",
+    "order": "o",
+    "family": "f",
+    "genus": "g",
+    "species": "s",
+}
+
+# ---- Colormap abundance ----
+abundance_boundaries = [0, 1, 2, 4, 8, 16, 40, 60, 80, 1000]
+abundance_colors = [
+    "#ffffff", "#e2f5e8", "#bfe6c9", "#88d0a6", "#48b07c",
+    "#219c6a", "#ffb67a", "#e0554a", "#7f1d1d"
+]
+abundance_labels = ["0", "1–2", "2–4", "4–8", "8–16", "16–40", "40–60", "60–80", ">80"]
+
+def extract_taxon(tax, rank="phylum"):
     if pd.isna(tax):
         return None
+    prefix = f"{rank_prefix[rank]}__"
     for part in str(tax).split(";"):
-        if part.startswith("p__"):
-            return part.replace("p__", "")
+        if part.startswith(prefix):
+            return part.replace(prefix, "")
     return None
 
+def extract_phylum(tax):
+    return extract_taxon(tax, "phylum")
+
 def normalize_id(id_str: str) -> str:
     """Normalize genome IDs to match gdtb IDs"""
     s = id_str.replace(".", "_")
@@ -25,24 +48,26 @@ def normalize_id(id_str: str) -> str:
 def clean_sample_label(s: str) -> str:
     return s.split()[0].replace(".fastq", "")
 
-def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str,
-                present_threshold: float = 0.0,
-                top_bar_spacing: float = 0.95,
-                top_bar_width: float = 0.90):
+def heatmap_data(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame,
+                 present_threshold: float = 0.0, rank: str = "phylum"):
     """
-    Combined visualization:
-    - top: log10(MAGs/Phylum)
-    - center: Heatmap showing relative abundance
-    - right: MAGs/sample
+    Aggregates of the combined heatmap:
+    - heat: sample x taxon summed relative abundance
+    - mags_per_taxon: number of MAGs per taxon
+    - mags_per_sample: number of detected MAGs per sample
     """
-    
-    # GTDB: Phylum-Column
-    gtdb = gtdb_df.copy()
-    if "classification" not in gtdb.columns:
+    if "classification" not in gtdb_df.columns:
         raise ValueError("GTDB-DataFrame has no column 'classification'.")
-    
-    gtdb["phylum"] = gtdb["classification"].apply(extract_phylum)
-    gtdb = gtdb[["phylum"]].dropna()
+
+    return cached("heatmap", [coverm_df, gtdb_df[["classification"]]],
+                  {"rank": rank, "present_threshold": present_threshold},
+                  lambda: _heatmap_data(coverm_df, gtdb_df, present_threshold, rank))
+
+def _heatmap_data(coverm_df, gtdb_df, present_threshold, rank):
+    # GTDB: Rank-Column
+    gtdb = gtdb_df.copy()
+    gtdb[rank] = gtdb["classification"].apply(lambda tax: extract_taxon(tax, rank))
+    gtdb = gtdb[[rank]].dropna()
     gtdb.index.name = "user_genome"
 
     # CoverM: Index->Column, map MAGs to gtdb taxonomy
@@ -50,39 +75,34 @@ def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str
     cov = cov.reset_index().rename(columns={cov.index.name or "index": "Genome", cov.columns[0]: cov.columns[0]})
     cov["user_genome"] = cov["Genome"].apply(normalize_id)
 
-    # Join MAGs to their gtdb phylum assignments
-    merged = cov.merge(gtdb, left_on="user_genome", right_index=True, how="left").dropna(subset=["phylum"])
+    # Join MAGs to their gtdb rank assignments
+    merged = cov.merge(gtdb, left_on="user_genome", right_index=True, how="left").dropna(subset=[rank])
 
-    # Coverm table to long format (sample, abundance, phylum)
-    id_cols = ["Genome", "user_genome", "phylum"]
+    # Coverm table to long format (sample, abundance, taxon)
+    id_cols = ["Genome", "user_genome", rank]
     value_cols = [c for c in merged.columns if c not in id_cols]
 
-    long_df = merged.melt(id_vars=["phylum"], value_vars=value_cols,
+    long_df = merged.melt(id_vars=[rank], value_vars=value_cols,
                           var_name="sample", value_name="abundance")
 
     all_samples = value_cols[:]
     clean_map = {s: clean_sample_label(s) for s in all_samples}
 
-    # ---- Heatmap-Matrix: Sample × Phylum ----
-    heat = (long_df.groupby(["sample", "phylum"], as_index=False)["abundance"].sum()
-                    .pivot(index="sample", columns="phylum", values="abundance")
+    # ---- Heatmap-Matrix: Sample × Taxon ----
+    heat = (long_df.groupby(["sample", rank], as_index=False)["abundance"].sum()
+                    .pivot(index="sample", columns=rank, values="abundance")
                     .fillna(0.0))
 
     heat.index = heat.index.map(lambda s: clean_map.get(s, clean_sample_label(s)))
 
-    # sort phyla by total abundance
+    # sort taxa by total abundance
     heat = heat.loc[:, heat.sum(axis=0).sort_values(ascending=False).index]
-    n_rows, n_cols = heat.shape
 
     # ---- Top bar chart ----
-    mags_per_phylum = (merged.groupby("phylum")["Genome"]
-                       .nunique()
-                       .reindex(heat.columns)
-                       .fillna(0).astype(int))
-    top_vals = pd.Series(np.log10(mags_per_phylum.replace(0, np.nan)),
-                         index=mags_per_phylum.index)
-    # top_vals = mags_per_phylum # wenn ohne log10 
-
+    mags_per_taxon = (merged.groupby(rank)["Genome"]
+                      .nunique()
+                      .reindex(heat.columns)
+                      .fillna(0).astype(int))
 
     # ---- Right bar chart ----
     cov_mag_sample = coverm_df.copy()
@@ -90,15 +110,23 @@ def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str
     mags_per_sample = (cov_mag_sample > present_threshold).sum(axis=0)
     mags_per_sample = mags_per_sample.reindex(heat.index).fillna(0).astype(int)
 
-    # ---- Colormap abundance ----
-    boundaries = [0, 1, 2, 4, 8, 16, 40, 60, 80, 1000]
-    colors = [
-        "#ffffff", "#e2f5e8", "#bfe6c9", "#88d0a6", "#48b07c",
-        "#219c6a", "#ffb67a", "#e0554a", "#7f1d1d"
-    ]
-    cmap = ListedColormap(colors)
-    norm = BoundaryNorm(boundaries, cmap.N, clip=True)
-    bin_labels = ["0", "1–2", "2–4", "4–8", "8–16", "16–40", "40–60", "60–80", ">80"]
+    return heat, mags_per_taxon, mags_per_sample
+
+def render_mag_heatmap(heat: pd.DataFrame, mags_per_taxon: pd.Series, mags_per_sample: pd.Series,
+                       output_path: str, rank: str = "phylum",
+                       top_bar_spacing: float = 0.95,
+                       top_bar_width: float = 0.90):
+    """Draw the combined heatmap from the aggregates of heatmap_data"""
+    n_rows, n_cols = heat.shape
+    label = rank.capitalize()
+
+    top_vals = pd.Series(np.log10(mags_per_taxon.replace(0, np.nan)),
+                         index=mags_per_taxon.index)
+    # top_vals = mags_per_taxon # wenn ohne log10 
+
+    cmap = ListedColormap(abundance_colors)
+    norm = BoundaryNorm(abundance_boundaries, cmap.N, clip=True)
+    boundaries = abundance_boundaries
 
     # ---- Layout ----
     fig = plt.figure(figsize=(max(10, n_cols * 0.6), max(8, n_rows * 0.3)))
@@ -128,7 +156,7 @@ def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str
     ax_heat.set_xticklabels(heat.columns, rotation=45, ha="right", fontsize=9)
     ax_heat.set_yticks(np.arange(n_rows))
     ax_heat.set_yticklabels(heat.index, rotation=0, fontsize=9)
-    ax_heat.set_xlabel("Phylum")
+    ax_heat.set_xlabel(label)
     ax_heat.set_ylabel("Samples")
 
     # Colorbar abundance
@@ -136,7 +164,7 @@ def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str
         im, ax=ax_heat, fraction=0.03, pad=0.02,
         ticks=[(boundaries[i]+boundaries[i+1])/2 for i in range(len(boundaries)-1)]
     )
-    cbar.ax.set_yticklabels(bin_labels)
+    cbar.ax.set_yticklabels(abundance_labels)
     cbar.set_label("Relative abundance (%)", rotation=90)
 
     # ---- Top bar ----
@@ -144,7 +172,7 @@ def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str
     ax_top.bar(x_pos, top_vals.values, color="#6b6b6b", edgecolor="#444444",
                width=top_bar_width, align="center")
     ax_top.set_xlim(-0.5, n_cols - 0.5)  # gleiche Breite wie Heatmap
-    ax_top.set_ylabel("log$_{10}$(MAGs/Phylum)")
+    ax_top.set_ylabel(f"log$_{{10}}$(MAGs/{label})")
     ax_top.set_xticks([])
     ax_top.axhline(0, color="#888888", linewidth=0.8)
 
@@ -155,9 +183,21 @@ def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str
     ax_right.set_yticks([])
     ax_right.grid(axis="x", linestyle="--", linewidth=0.5, alpha=0.6)
 
-    plt.suptitle("MAG distribution: samples × phyla", y=0.98, fontsize=12)
-    os.makedirs(output_path, exist_ok=True)
-    out_png = os.path.join(output_path, "heatmap_with_bars.png")
-    plt.savefig(out_png, dpi=300, bbox_inches="tight")
-    plt.close()
-    return out_png
\ No newline at end of file
+    taxa = "phyla" if rank == "phylum" else rank
+    plt.suptitle(f"MAG distribution: samples × {taxa}", y=0.98, fontsize=12)
+    return save_figure(fig, output_path, "heatmap_with_bars.png", dpi=300, bbox_inches="tight")
+
+def mag_heatmap(coverm_df: pd.DataFrame, gtdb_df: pd.DataFrame, output_path: str,
+                present_threshold: float = 0.0,
+                top_bar_spacing: float = 0.95,
+                top_bar_width: float = 0.90,
+                rank: str = "phylum"):
+    """
+    Combined visualization:
+    - top: log10(MAGs/Taxon)
+    - center: Heatmap showing relative abundance
+    - right: MAGs/sample
+    """
+    heat, mags_per_taxon, mags_per_sample = heatmap_data(coverm_df, gtdb_df, present_threshold, rank)
+    return render_mag_heatmap(heat, mags_per_taxon, mags_per_sample, output_path, rank,
+                              top_bar_spacing, top_bar_width)
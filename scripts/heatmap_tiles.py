@@ -0,0 +1,199 @@
+import io
+import json
+import math
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.colors import BoundaryNorm, to_rgb
+from PIL import Image
+from sinks import save_bytes
+from heatmap import abundance_boundaries, abundance_colors, abundance_labels
+
+def matrix_pyramid(values, n_levels, agg="mean"):
+    """
+    Matrix for every zoom level, coarsest first. Each level halves the previous
+    one by combining 2x2 cell blocks of the matrix (mean or max), never pixels.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    sums, counts = values, np.ones_like(values)
+    levels = [values]
+
+    for _ in range(n_levels - 1):
+        pad = ((0, sums.shape[0] % 2), (0, sums.shape[1] % 2))
+        rows, cols = (sums.shape[0] + 1) // 2, (sums.shape[1] + 1) // 2
+
+        if agg == "max":
+            sums = np.pad(sums, pad, constant_values=np.nan).reshape(rows, 2, cols, 2)
+            with np.errstate(invalid="ignore"):
+                sums = np.fmax.reduce(np.fmax.reduce(sums, axis=3), axis=1)
+            levels.append(sums)
+            continue
+
+        sums = np.pad(sums, pad).reshape(rows, 2, cols, 2).sum(axis=(1, 3))
+        counts = np.pad(counts, pad).reshape(rows, 2, cols, 2).sum(axis=(1, 3))
+        levels.append(np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0))
+
+    return levels[::-1]
+
+def render_tile(cells, norm, palette, cell_px, tile_size):
+    """
+    Encode one block of matrix cells as a tile_size palette PNG, one palette entry
+    per abundance bin and a transparent entry outside the matrix.
+    """
+    transparent = norm.Ncmap
+    index = np.full((tile_size, tile_size), transparent, dtype=np.uint8)
+    bins = np.where(np.isnan(cells), transparent, norm(np.nan_to_num(cells)).filled(transparent))
+    pixels = bins.astype(np.uint8).repeat(cell_px, axis=0).repeat(cell_px, axis=1)
+    index[:pixels.shape[0], :pixels.shape[1]] = pixels
+
+    tile = Image.fromarray(index, mode="P")
+    tile.putpalette(palette)
+    buf = io.BytesIO()
+    tile.save(buf, format="png", transparency=transparent, compress_level=1)
+    return buf.getvalue()
+
+def heatmap_tile_pyramid(heat: pd.DataFrame, output_path, rank: str = "phylum",
+                         name: str = "heatmap_tiles", tile_size: int = 256, cell_px: int = 8,
+                         agg: str = "mean", workers: int = None):
+    """
+    Deep-zoom output of a sample x taxon abundance matrix: PNG tiles for every
+    zoom level (<name>/tiles/<level>/<x>_<y>.png) plus <name>/index.html that
+    loads only the tiles in view. Tiles are encoded in parallel.
+    """
+    cells_per_tile = tile_size // cell_px
+    n_rows, n_cols = heat.shape
+    n_levels = max(0, math.ceil(math.log2(max(n_rows, n_cols, 1) / cells_per_tile))) + 1
+
+    norm = BoundaryNorm(abundance_boundaries, len(abundance_colors), clip=True)
+    palette = [int(255 * v) for color in abundance_colors for v in to_rgb(color)] + [0, 0, 0]
+
+    jobs = []
+    for z, level in enumerate(matrix_pyramid(heat.to_numpy(), n_levels, agg)):
+        for ty in range(0, level.shape[0], cells_per_tile):
+            for tx in range(0, level.shape[1], cells_per_tile):
+                cells = level[ty:ty + cells_per_tile, tx:tx + cells_per_tile]
+                jobs.append((cells, f"{name}/tiles/{z}/{tx // cells_per_tile}_{ty // cells_per_tile}.png"))
+
+    def write_tile(job):
+        cells, tile_name = job
+        save_bytes(render_tile(cells, norm, palette, cell_px, tile_size), output_path, tile_name)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(write_tile, jobs))
+
+    meta = {
+        "title": f"MAG distribution: samples × {rank}",
+        "rank": rank.capitalize(),
+        "rows": [str(r) for r in heat.index],
+        "cols": [str(c) for c in heat.columns],
+        "levels": n_levels,
+        "tile_size": tile_size,
+        "cell_px": cell_px,
+        "agg": agg,
+        "legend": list(zip(abundance_colors, abundance_labels)),
+    }
+    html = viewer_template.replace("__META__", json.dumps(meta)).encode("utf-8")
+    save_bytes(html, output_path, f"{name}/index.html")
+
+    print(f"[INFO] Saved: {name}/index.html ({len(jobs)} tiles, {n_levels} zoom levels)")
+    return html
+
+viewer_template = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Heatmap viewer</title>
+<style>
+  body { margin: 0; font-family: sans-serif; font-size: 13px; }
+  #bar { padding: 6px 10px; border-bottom: 1px solid #ccc; display: flex; gap: 16px; align-items: center; }
+  #view { position: absolute; top: 36px; bottom: 0; left: 0; right: 0; overflow: hidden; background: #f4f4f4; cursor: grab; }
+  #view img { position: absolute; image-rendering: pixelated; pointer-events: none; }
+  .swatch { display: inline-block; width: 12px; height: 12px; border: 1px solid #999; margin: 0 2px 0 8px; vertical-align: middle; }
+</style>
+</head>
+<body>
+<div id="bar"><b id="title"></b><span id="legend"></span><span id="info"></span></div>
+<div id="view"></div>
+<script>
+const meta = __META__;
+const view = document.getElementById("view");
+const info = document.getElementById("info");
+const nRows = meta.rows.length, nCols = meta.cols.length;
+const cellsPerTile = meta.tile_size / meta.cell_px, maxLevel = meta.levels - 1;
+const tiles = new Map();
+let zoom, ox, oy;
+
+document.getElementById("title").textContent = meta.title;
+document.getElementById("legend").innerHTML = "Relative abundance (%):" + meta.legend.map(
+  ([color, label]) => `<span class="swatch" style="background:${color}"></span>${label}`).join("");
+
+function fit() {
+  zoom = Math.min(view.clientWidth / nCols, view.clientHeight / nRows) * 0.95;
+  ox = (view.clientWidth - nCols * zoom) / 2;
+  oy = (view.clientHeight - nRows * zoom) / 2;
+}
+
+function render() {
+  // level whose native block size is closest to the on-screen size of a cell block
+  const z = Math.max(0, Math.min(maxLevel, maxLevel - Math.round(Math.log2(meta.cell_px / zoom))));
+  const factor = 2 ** (maxLevel - z);
+  const span = cellsPerTile * factor * zoom;
+  const levelTiles = Math.ceil(nCols / factor / cellsPerTile), levelTilesY = Math.ceil(nRows / factor / cellsPerTile);
+  const x0 = Math.max(0, Math.floor(-ox / span)), x1 = Math.min(levelTiles - 1, Math.floor((view.clientWidth - ox) / span));
+  const y0 = Math.max(0, Math.floor(-oy / span)), y1 = Math.min(levelTilesY - 1, Math.floor((view.clientHeight - oy) / span));
+
+  const visible = new Set();
+  for (let ty = y0; ty <= y1; ty++) {
+    for (let tx = x0; tx <= x1; tx++) {
+      const key = `${z}/${tx}_${ty}`;
+      visible.add(key);
+      let img = tiles.get(key);
+      if (!img) {
+        img = new Image();
+        img.src = `tiles/${key}.png`;
+        tiles.set(key, img);
+        view.appendChild(img);
+      }
+      img.style.display = "block";
+      img.style.left = `${ox + tx * span}px`;
+      img.style.top = `${oy + ty * span}px`;
+      img.style.width = img.style.height = `${span}px`;
+    }
+  }
+  for (const [key, img] of tiles) {
+    if (!visible.has(key)) img.style.display = "none";
+  }
+}
+
+view.addEventListener("wheel", (e) => {
+  e.preventDefault();
+  const factor = e.deltaY < 0 ? 1.25 : 0.8;
+  const rect = view.getBoundingClientRect();
+  const mx = e.clientX - rect.left, my = e.clientY - rect.top;
+  ox = mx - (mx - ox) * factor;
+  oy = my - (my - oy) * factor;
+  zoom *= factor;
+  render();
+}, { passive: false });
+
+let drag = null;
+view.addEventListener("mousedown", (e) => { drag = [e.clientX - ox, e.clientY - oy]; view.style.cursor = "grabbing"; });
+window.addEventListener("mouseup", () => { drag = null; view.style.cursor = "grab"; });
+view.addEventListener("mousemove", (e) => {
+  if (drag) {
+    ox = e.clientX - drag[0];
+    oy = e.clientY - drag[1];
+    render();
+  }
+  const rect = view.getBoundingClientRect();
+  const col = Math.floor((e.clientX - rect.left - ox) / zoom), row = Math.floor((e.clientY - rect.top - oy) / zoom);
+  info.textContent = (row >= 0 && row < nRows && col >= 0 && col < nCols)
+    ? `Sample: ${meta.rows[row]} | ${meta.rank}: ${meta.cols[col]}` : "";
+});
+window.addEventListener("resize", render);
+fit();
+render();
+</script>
+</body>
+</html>
+"""
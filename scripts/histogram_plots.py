@@ -1,5 +1,5 @@
-import os
 import matplotlib.pyplot as plt
+from sinks import save_figure
 
 def create_n50_histogram(checkm2, output_path):
     df = checkm2.loc[:,['Contig_N50']]
@@ -8,7 +8,7 @@ def create_n50_histogram(checkm2, output_path):
 
     df = df / 1000
 
-    plt.figure()
+    fig = plt.figure()
     plt.hist(df, bins='auto', color='skyblue', edgecolor='black')
 
     plt.xlim(0, df['N50(kbp)'].max())
@@ -18,14 +18,14 @@ def create_n50_histogram(checkm2, output_path):
 
     plt.xticks(plt.xticks()[0], [f'{int(x)} kb' for x in plt.xticks()[0]])
 
-    plt.savefig(os.path.join(output_path, "n50_histogram.png"))
+    return save_figure(fig, output_path, "n50_histogram.png")
 
 def number_of_contigs(checkm2, output_path):
     df = checkm2.loc[:,['Total_Contigs']]
 
     df.rename(columns={'Total_Contigs': '# Contig'}, inplace=True)
     
-    plt.figure()
+    fig = plt.figure()
     plt.hist(df, bins='auto', color='skyblue', edgecolor='black')
 
     plt.xlim(0, df['# Contig'].max())
@@ -33,7 +33,7 @@ def number_of_contigs(checkm2, output_path):
     plt.xlabel('Number of contigs per genome')
     plt.ylabel('Frequency')
 
-    plt.savefig(os.path.join(output_path, "number_of_contig_his.png"))
+    return save_figure(fig, output_path, "number_of_contig_his.png")
 
 def create_assambly_info_histo(checkm2, output_path):
     df = checkm2.reset_index().loc[:,['Name', 'Contig_N50', 'Genome_Size', 'Max_Contig_Length', 'Coding_Density']]
@@ -53,4 +53,4 @@ def create_assambly_info_histo(checkm2, output_path):
 
     plt.tight_layout()
 
-    plt.savefig(os.path.join(output_path, "assambly_info_histo.png"))
\ No newline at end of file
+    return save_figure(fig, output_path, "assambly_info_histo.png")
\ No newline at end of file
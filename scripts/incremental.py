@@ -0,0 +1,150 @@
+import hashlib
+import io
+import json
+import os
+import pandas as pd
+from heatmap import extract_taxon, normalize_id, clean_sample_label
+
+STATE_VERSION = 1
+
+def read_table(file_name, content):
+    """Parse one CoverM file from its bytes, separator chosen by file extension"""
+    if file_name.endswith(".tsv") or file_name.endswith(".tabular"):
+        return pd.read_csv(io.BytesIO(content), sep="\t", index_col=0)
+    return pd.read_csv(io.BytesIO(content), index_col=0)
+
+def gtdb_fingerprint(gtdb):
+    """Hash of the GTDB assignments; the state is rebuilt when it changes"""
+    return str(pd.util.hash_pandas_object(gtdb["classification"], index=True).sum())
+
+def _empty_state(rank, present_threshold, fingerprint):
+    return {
+        "manifest": {"version": STATE_VERSION, "rank": rank, "present_threshold": present_threshold,
+                     "gtdb": fingerprint, "files": {}},
+        "taxon_sums": pd.DataFrame(dtype=float),
+        "genomes": pd.DataFrame({"taxon": pd.Series(dtype=object)}),
+        "detected": pd.Series(dtype=int),
+    }
+
+def load_state(state_path):
+    manifest_file = os.path.join(state_path, "manifest.json")
+    if not os.path.exists(manifest_file):
+        return None
+
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    detected = pd.read_parquet(os.path.join(state_path, "detected.parquet"))["mags"]
+    return {
+        "manifest": manifest,
+        "taxon_sums": pd.read_parquet(os.path.join(state_path, "taxon_sums.parquet")),
+        "genomes": pd.read_parquet(os.path.join(state_path, "genomes.parquet")),
+        "detected": detected,
+    }
+
+def save_state(state, state_path):
+    os.makedirs(state_path, exist_ok=True)
+    state["taxon_sums"].to_parquet(os.path.join(state_path, "taxon_sums.parquet"))
+    state["genomes"].to_parquet(os.path.join(state_path, "genomes.parquet"))
+    state["detected"].rename("mags").to_frame().to_parquet(os.path.join(state_path, "detected.parquet"))
+    with open(os.path.join(state_path, "manifest.json"), "w") as f:
+        json.dump(state["manifest"], f, indent=1)
+
+def append_sample_file(state, df, gtdb):
+    """Add the samples (columns) of one CoverM file to the aggregated state"""
+    rank = state["manifest"]["rank"]
+    df = df.apply(pd.to_numeric, errors="coerce").fillna(0.0)
+
+    # MAGs/sample counts every row, like heatmap_data
+    detected = (df > state["manifest"]["present_threshold"]).sum(axis=0)
+
+    taxa = (pd.Series([normalize_id(str(g)) for g in df.index], index=df.index)
+            .map(gtdb["classification"])
+            .map(lambda tax: extract_taxon(tax, rank)))
+    mapped = taxa.notna()
+
+    sums = df[mapped].groupby(taxa[mapped]).sum()
+    genomes = pd.DataFrame({"taxon": taxa[mapped]})
+    genomes.index = genomes.index.astype(str)
+
+    if state["manifest"]["files"]:
+        state["taxon_sums"] = pd.concat([state["taxon_sums"], sums], axis=1).fillna(0.0)
+        state["genomes"] = pd.concat([state["genomes"], genomes[~genomes.index.isin(state["genomes"].index)]])
+        state["detected"] = pd.concat([state["detected"], detected])
+    else:
+        state["taxon_sums"], state["genomes"], state["detected"] = sums, genomes, detected
+
+def _file_changed(entry, path):
+    """Stat check first; only files whose size or mtime moved are hashed"""
+    stat = os.stat(path)
+    if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return False
+
+    with open(path, "rb") as f:
+        if hashlib.sha256(f.read()).hexdigest() != entry["sha256"]:
+            return True
+    entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    return False
+
+def update_coverm_state(coverm_path, gtdb, state_path, rank="phylum", present_threshold=0.0):
+    """
+    Bring the persisted taxon x sample aggregation up to date with the CoverM folder.
+    Files whose size and mtime are unchanged are never opened; new files are parsed
+    once and appended as new sample columns. A changed or removed file, a different
+    rank/threshold or new GTDB assignments rebuild the state from all files.
+    """
+    fingerprint = gtdb_fingerprint(gtdb)
+    state = load_state(state_path)
+    files = sorted(f for f in os.listdir(coverm_path) if os.path.isfile(os.path.join(coverm_path, f)))
+
+    if state is not None:
+        manifest = state["manifest"]
+        known = manifest["files"]
+        if (manifest["version"], manifest["rank"], manifest["present_threshold"], manifest["gtdb"]) != \
+                (STATE_VERSION, rank, present_threshold, fingerprint):
+            print("[INFO] CoverM state was built with other settings, rebuilding")
+            state = None
+        elif any(f not in files for f in known):
+            print("[INFO] CoverM file removed, rebuilding state")
+            state = None
+        elif any(_file_changed(known[f], os.path.join(coverm_path, f)) for f in files if f in known):
+            print("[INFO] CoverM file changed, rebuilding state")
+            state = None
+
+    if state is None:
+        state = _empty_state(rank, present_threshold, fingerprint)
+
+    known = state["manifest"]["files"]
+    new_files = [f for f in files if f not in known]
+    for file_name in new_files:
+        path = os.path.join(coverm_path, file_name)
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            content = f.read()
+
+        df = read_table(file_name, content)
+        append_sample_file(state, df, gtdb)
+        known[file_name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                            "sha256": hashlib.sha256(content).hexdigest(),
+                            "samples": [str(c) for c in df.columns]}
+        print(f"[INFO] {file_name} appended: {df.shape} rows x columns")
+
+    save_state(state, state_path)
+    print(f"[INFO] CoverM state: {len(known)} files, {len(new_files)} new, {state['taxon_sums'].shape[1]} samples")
+    return state
+
+def state_heatmap_data(state):
+    """heat, mags_per_taxon and mags_per_sample as returned by heatmap_data"""
+    heat = state["taxon_sums"].T.sort_index()
+    heat.index = heat.index.map(lambda s: clean_sample_label(str(s)))
+    heat.index.name = "sample"
+    heat.columns.name = state["manifest"]["rank"]
+    heat = heat.loc[:, heat.sum(axis=0).sort_values(ascending=False).index]
+
+    mags_per_taxon = (state["genomes"]["taxon"].value_counts()
+                      .reindex(heat.columns).fillna(0).astype(int))
+
+    detected = state["detected"].copy()
+    detected.index = detected.index.map(lambda s: clean_sample_label(str(s)))
+    mags_per_sample = detected.reindex(heat.index).fillna(0).astype(int)
+
+    return heat, mags_per_taxon, mags_per_sample
@@ -0,0 +1,175 @@
+import re
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from sinks import save_html
+from heatmap import rank_prefix, normalize_id
+
+ranks = list(rank_prefix)
+
+class LineageTrie:
+    """
+    GTDB lineages of all MAGs as one trie. Nodes live in flat arrays (name,
+    parent, depth, MAG count, abundance) and are numbered depth by depth, so
+    every child comes after its parent. Node 0 is the root, depth 1 the domain.
+    A MAG is counted at the deepest rank with a name ("s__" ends a lineage at
+    genus) and the counts are summed up to all ancestors in one bottom-up pass.
+    Empty ranks get no node; rank_counts reports them as "Unknow <Rank>".
+    """
+
+    def __init__(self, classification, abundance=None):
+        genomes = classification.dropna()
+        parts = genomes.astype(str).str.split(";", expand=True).reindex(columns=range(len(ranks)))
+        parts = parts.apply(lambda col: col.str.strip())
+        # number of rank fields per lineage, "p__" included
+        self.genome_fields = parts.notna().sum(axis=1).to_numpy()
+
+        names, parents, depths = ["root"], [-1], [0]
+        node_of_genome = np.zeros(len(genomes), dtype=np.int64)
+        open_lineage = np.ones(len(genomes), dtype=bool)
+
+        for depth, rank in enumerate(ranks, start=1):
+            column = parts[depth - 1]
+            named = open_lineage & column.notna().to_numpy() & (column.str.len() > 3).to_numpy()
+            open_lineage = named
+            if not named.any():
+                break
+
+            name_codes, level_names = pd.factorize(column[named])
+            # a node is a (parent node, name) pair, so equal names under different parents stay apart
+            keys = node_of_genome[named] * len(level_names) + name_codes
+            key_codes, unique_keys = pd.factorize(keys, sort=True)
+
+            first_id = len(names)
+            names.extend(level_names[unique_keys % len(level_names)])
+            parents.extend(unique_keys // len(level_names))
+            depths.extend([depth] * len(unique_keys))
+            node_of_genome[named] = first_id + key_codes
+
+        self.names = np.asarray(names, dtype=object)
+        self.parent = np.asarray(parents, dtype=np.int64)
+        self.depth = np.asarray(depths, dtype=np.int8)
+        self.genome_node = pd.Series(node_of_genome, index=genomes.index)
+
+        self.mags = self.roll_up(np.bincount(node_of_genome, minlength=len(self.names)))
+        self.genome_mags = np.ones(len(genomes), dtype=np.int64)
+        self.abundance = self.genome_abundance = None
+        if abundance is not None:
+            self.genome_abundance = abundance.reindex(genomes.index).fillna(0.0).to_numpy(dtype=float)
+            self.abundance = self.roll_up(np.bincount(node_of_genome, weights=self.genome_abundance,
+                                                      minlength=len(self.names)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def roll_up(self, values):
+        """Add every node's value to all its ancestors, deepest rank first"""
+        totals = np.array(values, copy=True)
+        for depth in range(self.depth.max(), 0, -1):
+            nodes = np.flatnonzero(self.depth == depth)
+            np.add.at(totals, self.parent[nodes], totals[nodes])
+        return totals
+
+    def rank_counts(self, rank, values="mags"):
+        """
+        MAG count (or abundance) per taxon of a rank, largest first like
+        value_counts. MAGs whose lineage lists the rank empty are counted as
+        "Unknow <Rank>".
+        """
+        depth = ranks.index(rank) + 1
+        nodes = np.flatnonzero(self.depth == depth)
+
+        # ancestor of every MAG at this rank, for the position where a taxon first occurs
+        node = self.genome_node.to_numpy().copy()
+        deeper = self.depth[node] > depth
+        while deeper.any():
+            node[deeper] = self.parent[node[deeper]]
+            deeper = self.depth[node] > depth
+        first_seen = np.full(len(self), len(node))
+        np.minimum.at(first_seen, node, np.arange(len(node)))
+
+        counts = pd.DataFrame({"label": self.labels(nodes), "value": getattr(self, values)[nodes],
+                               "first": first_seen[nodes]})
+        unknown = (self.genome_fields >= depth) & (self.depth[node] < depth)
+        if unknown.any():
+            counts.loc[len(counts)] = [f"Unknow {rank.capitalize()}",
+                                       getattr(self, f"genome_{values}")[unknown].sum(), np.argmax(unknown)]
+
+        # names are unique per parent only, the same name can occur under two parents;
+        # ties keep the input order like value_counts
+        counts = counts.groupby("label").agg(value=("value", "sum"), first=("first", "min")).sort_values("first")
+        return (counts["value"].sort_values(ascending=False, kind="stable")
+                .rename("count" if values == "mags" else values).rename_axis(rank.capitalize()))
+
+    def labels(self, nodes):
+        # "Unclassified Bacteria" style names have no rank prefix
+        return [re.sub(r"^[a-z]__", "", name) for name in self.names[nodes]]
+
+    def prune(self, max_depth=len(ranks), min_size=1, values="mags"):
+        """
+        Nodes down to max_depth with at least min_size MAGs (or abundance). Node
+        sizes never grow with depth, so dropping a node also drops its subtree.
+        """
+        size = getattr(self, values)
+        keep = (self.depth <= max_depth) & (size >= min_size)
+        keep[0] = False
+        return np.flatnonzero(keep)
+
+    def to_frame(self, nodes=None):
+        nodes = np.arange(1, len(self)) if nodes is None else nodes
+        frame = pd.DataFrame({
+            "id": nodes,
+            "parent": np.where(self.parent[nodes] > 0, self.parent[nodes], -1),
+            "rank": [ranks[d - 1] for d in self.depth[nodes]],
+            "name": self.labels(nodes),
+            "mags": self.mags[nodes],
+        })
+        if self.abundance is not None:
+            frame["abundance"] = self.abundance[nodes]
+        return frame
+
+def mag_abundance(coverm):
+    """Mean relative abundance of every MAG over all CoverM samples, indexed like the GTDB table"""
+    abundance = coverm.drop(index="unmapped", errors="ignore").apply(pd.to_numeric, errors="coerce")
+    abundance = abundance.fillna(0.0).mean(axis=1)
+    abundance.index = [normalize_id(str(g)) for g in abundance.index]
+    return abundance.groupby(level=0).sum()
+
+def lineage_plots(gtdb, output_path, coverm=None, max_depth="genus", min_mags=1, values="mags"):
+    """Sunburst and icicle of the GTDB lineages, pruned to max_depth and min_mags"""
+    abundance = mag_abundance(coverm) if coverm is not None else None
+    trie = LineageTrie(gtdb["classification"], abundance)
+    if values == "abundance" and trie.abundance is None:
+        print("[INFO] No CoverM abundance available, lineage plots use MAG counts")
+        values = "mags"
+
+    nodes = trie.prune(ranks.index(max_depth) + 1, min_mags, "mags")
+    frame = trie.to_frame(nodes)
+    print(f"[INFO] Lineage trie: {len(trie)} nodes, {len(nodes)} shown")
+
+    # plotly sizes a node by its own remainder plus its shown children, so pruned
+    # subtrees stay inside their parent and float sums never exceed the parent
+    size = getattr(trie, values)
+    shown_children = np.zeros(len(trie), dtype=size.dtype)
+    np.add.at(shown_children, trie.parent[nodes], size[nodes])
+    remainder = np.clip(size[nodes] - shown_children[nodes], 0, None)
+
+    ids = frame["id"].astype(str)
+    parents = frame["parent"].map(lambda p: "" if p < 0 else str(p))
+    hover = "%{label}<br>%{customdata[0]}<br>MAGs: %{customdata[1]}"
+    custom = frame[["rank", "mags"]].to_numpy()
+    if "abundance" in frame:
+        hover += "<br>Mean abundance: %{customdata[2]:.2f}%"
+        custom = frame[["rank", "mags", "abundance"]].to_numpy()
+
+    title = f"GTDB lineages down to {max_depth} ({'MAG count' if values == 'mags' else 'mean relative abundance'})"
+    figs = []
+    for trace, name in ((go.Sunburst, "lineage_sunburst.html"), (go.Icicle, "lineage_icicle.html")):
+        fig = go.Figure(trace(
+            ids=ids, labels=frame["name"], parents=parents, values=remainder,
+            branchvalues="remainder", customdata=custom, hovertemplate=hover + "<extra></extra>",
+        ))
+        fig.update_layout(title_text=title, margin=dict(t=50, l=10, r=10, b=10), height=900)
+        figs.append(save_html(fig, output_path, name))
+
+    return figs
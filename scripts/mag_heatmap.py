@@ -1,12 +1,12 @@
 import matplotlib.pyplot as plt
 import seaborn as sns
-import os
+from sinks import save_figure
 
 def mag_detection_heatmap(coverm, output_path):
 
     num_bins, num_samples = coverm.shape
 
-    plt.figure(figsize=(max(10, num_samples*1.2), max(6, num_bins*0.3)))
+    fig = plt.figure(figsize=(max(10, num_samples*1.2), max(6, num_bins*0.3)))
 
     sns.heatmap(coverm, cmap= sns.diverging_palette(240, 10, as_cmap=True), annot=True, cbar_kws={'label': 'Abundance'}, linewidths=0.5,linecolor='gray')
 
@@ -17,4 +17,4 @@ def mag_detection_heatmap(coverm, output_path):
     plt.ylabel("MAGs")
     plt.tight_layout()
     
-    plt.savefig(os.path.join(output_path, "mag_detection_heatmap.png"))
\ No newline at end of file
+    return save_figure(fig, output_path, "mag_detection_heatmap.png")
\ No newline at end of file
@@ -5,15 +5,29 @@ import numpy as np
 import argparse
 import time
 import os
+import sys
 from version import __version__
 from sanky_taxa import generate_taxa_sanky,taxa_sanky_rank
 from comp_conta_plot import completeness_contamination_plot, rank_completeness_contamination_plot
 from species_level_plot import species_level_plot
 from mag_heatmap import mag_detection_heatmap
-from heatmap import mag_heatmap
+from heatmap import heatmap_data, render_mag_heatmap
+from incremental import update_coverm_state, state_heatmap_data
+from heatmap_tiles import heatmap_tile_pyramid
 from histogram_plots import create_n50_histogram, number_of_contigs, create_assambly_info_histo
 from rank_dist_plot import rank_distribution_pie
-from amber_plots import binner_plot
+from multi_rank import all_rank_plots, ranks as all_ranks
+from lineage import lineage_plots
+from cache import TableCache, set_cache, get_cache
+from drep_ani import drep_ani_plots
+from stream import stream_plots
+from preview import load_preview, write_preview_note
+from amber_plots import binner_plot, binner_metrics_plot
+from sinks import open_sink
+from sample_accumulation import sample_accumulation_plot
+from cooccurrence import cooccurrence_network
+from dashboard import write_dashboard
+from qc_summary import write_qc_summary, load_qc_summaries, merge_qc_summaries, plot_qc_summary
 
 def positive_int(value):
     ivalue = int(value)
@@ -21,6 +35,12 @@ def positive_int(value):
         raise argparse.ArgumentTypeError(f"{value} must be >= 5")
     return ivalue
 
+def at_least_one(value):
+    ivalue = int(value)
+    if ivalue < 1:
+        raise argparse.ArgumentTypeError(f"{value} must be >= 1")
+    return ivalue
+
 def parse_arguments():
 
     parser = argparse.ArgumentParser(
@@ -76,7 +96,7 @@ def parse_arguments():
     parser.add_argument(
         '-o',
         '--output',
-        help="Path to the output folder to save the plots",
+        help="Path to the output folder to save the plots, or a .zip/.tar/.tar.gz archive to collect them in one file",
         dest="output",
         default=None
     )
@@ -84,8 +104,43 @@ def parse_arguments():
     parser.add_argument(
         '-r',
         '--rank',
-        help="Select which rank should be used for the rank sanky",
-        choices=["domain", "phylum", "class", "order", "family", "genus", "species"]
+        help="Rank(s) used for the rank sanky, pie and colored scatter; 'all' or several ranks write one set per rank "
+             "(suffixed by rank, the accumulation curve and stream mode use the first)",
+        nargs='+',
+        choices=["domain", "phylum", "class", "order", "family", "genus", "species", "all"]
+    )
+
+    parser.add_argument(
+        '--rank_workers',
+        help="Number of processes rendering the per-rank plots when several ranks are selected",
+        type=int,
+        dest='rank_workers',
+        default=4
+    )
+
+    parser.add_argument(
+        '--sankey_format',
+        help="Output format(s) of the Sankey plots; png/svg/pdf are drawn with matplotlib, no browser needed. DEFAULT: html",
+        nargs='+',
+        choices=["html", "png", "svg", "pdf"],
+        dest='sankey_format',
+        default=["html"]
+    )
+
+    parser.add_argument(
+        '--sankey_max_nodes',
+        help="Static Sankeys: maximum nodes per column, the smallest are merged into 'Other'",
+        type=positive_int,
+        dest='sankey_max_nodes',
+        default=30
+    )
+
+    parser.add_argument(
+        '--sankey_max_links',
+        help="Static Sankeys: maximum number of links, the smallest are left out",
+        type=positive_int,
+        dest='sankey_max_links',
+        default=300
     )
 
     parser.add_argument(
@@ -97,6 +152,67 @@ def parse_arguments():
         default=5
     )
 
+    parser.add_argument(
+        '--permutations',
+        help='Number of random sample orders for the MAG accumulation curves',
+        type=int,
+        dest='permutations',
+        default=100
+    )
+
+    parser.add_argument(
+        '--top_k',
+        help='Maximum number of co-occurrence partners kept per MAG (or taxon). Min: 1',
+        type=at_least_one,
+        dest='top_k',
+        default=10
+    )
+
+    parser.add_argument(
+        '--cooccurrence_rank',
+        help="Build the co-occurrence network between taxa of this rank instead of single MAGs",
+        choices=["domain", "phylum", "class", "order", "family", "genus", "species"],
+        dest='cooccurrence_rank',
+        default=None
+    )
+
+    parser.add_argument(
+        '--min_jaccard',
+        help='Minimum Jaccard index of a co-occurrence edge',
+        type=float,
+        dest='min_jaccard',
+        default=0.3
+    )
+
+    parser.add_argument(
+        '--drep_ndb',
+        help="Input dRep Ndb.csv (secondary ANI comparisons) for within-cluster ANI plots",
+        dest='drep_ndb_file',
+        default=None
+    )
+
+    parser.add_argument(
+        '--drep_mdb',
+        help="Input dRep Mdb.csv (primary Mash comparisons), used for the ANI plots if no Ndb.csv is given",
+        dest='drep_mdb_file',
+        default=None
+    )
+
+    parser.add_argument(
+        '--stream',
+        help="Read GTDB, CheckM and CheckM2 in chunks and only render the count/histogram based plots (pie, Sankey, completeness/contamination, CheckM2 histograms); memory is bounded by --chunk_size",
+        action='store_true',
+        dest='stream'
+    )
+
+    parser.add_argument(
+        '--chunk_size',
+        help="Number of rows read at once from large tables",
+        type=int,
+        dest='chunk_size',
+        default=1000000
+    )
+
     parser.add_argument(
         '--amber',
         help="Input CAMI amber result file for different plots",
@@ -104,6 +220,14 @@ def parse_arguments():
         default=None
     )
 
+    parser.add_argument(
+        '--bootstrap',
+        help="Number of bootstrap resamples for the confidence intervals of the AMBER metrics",
+        type=int,
+        dest='bootstrap',
+        default=1000
+    )
+
     parser.add_argument(
         '--gtdb_bac',
         help="Input GTDB bacteria result file",
@@ -118,6 +242,135 @@ def parse_arguments():
         default=None
     )
 
+    parser.add_argument(
+        '--heatmap_rank',
+        help="Rank used to aggregate the abundance heatmap",
+        choices=["domain", "phylum", "class", "order", "family", "genus", "species"],
+        dest='heatmap_rank',
+        default='phylum'
+    )
+
+    parser.add_argument(
+        '--heatmap_tiles',
+        help="Write the abundance heatmap as a zoomable tile pyramid (heatmap_tiles/index.html) instead of a PNG",
+        action='store_true',
+        dest='heatmap_tiles'
+    )
+
+    parser.add_argument(
+        '--incremental',
+        help="Keep the aggregated CoverM state in the output folder and only read new CoverM files. Plots that need the full CoverM matrix are skipped",
+        action='store_true',
+        dest='incremental'
+    )
+
+    parser.add_argument(
+        '--dashboard',
+        help="Also write all views into one self-contained dashboard.html",
+        action='store_true',
+        dest='dashboard'
+    )
+
+    parser.add_argument(
+        '--lineage',
+        help="Also write the GTDB lineages as sunburst and icicle (lineage_sunburst.html, lineage_icicle.html)",
+        action='store_true',
+        dest='lineage'
+    )
+
+    parser.add_argument(
+        '--lineage_depth',
+        help="Deepest rank shown in the lineage plots",
+        choices=["domain", "phylum", "class", "order", "family", "genus", "species"],
+        dest='lineage_depth',
+        default='genus'
+    )
+
+    parser.add_argument(
+        '--lineage_min_mags',
+        help="Hide lineage nodes with fewer MAGs",
+        type=int,
+        dest='lineage_min_mags',
+        default=1
+    )
+
+    parser.add_argument(
+        '--lineage_values',
+        help="Size of the lineage nodes: number of MAGs or mean CoverM relative abundance",
+        choices=["mags", "abundance"],
+        dest='lineage_values',
+        default='mags'
+    )
+
+    parser.add_argument(
+        '--preview',
+        help="Render all plots from a reproducible subsample of MAGs (stratified by phylum and MIMAG tier) and CoverM samples into <output>/preview",
+        action='store_true',
+        dest='preview'
+    )
+
+    parser.add_argument(
+        '--preview_mags',
+        help="Approximate number of MAGs in the preview",
+        type=int,
+        dest='preview_mags',
+        default=2000
+    )
+
+    parser.add_argument(
+        '--preview_samples',
+        help="Number of CoverM samples in the preview",
+        type=int,
+        dest='preview_samples',
+        default=20
+    )
+
+    parser.add_argument(
+        '--preview_seed',
+        help="Seed of the preview subsample",
+        type=int,
+        dest='preview_seed',
+        default=0
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        help="Folder for cached intermediate tables; re-runs on unchanged inputs skip their computation",
+        dest='cache_dir',
+        default=None
+    )
+
+    parser.add_argument(
+        '--cache_size',
+        help="Maximum size of the cache folder in MB, least recently used tables are removed first",
+        type=float,
+        dest='cache_size',
+        default=512
+    )
+
+    parser.add_argument(
+        '--encode_workers',
+        help="Number of background threads encoding the PNGs while the next plot is computed (0: encode in place)",
+        type=int,
+        dest='encode_workers',
+        default=1
+    )
+
+    parser.add_argument(
+        '--qc_summary',
+        help="Also save a mergeable summary of the CheckM2 metrics (qc_summary.json) in the output folder",
+        action='store_true',
+        dest='qc_summary'
+    )
+
+    parser.add_argument(
+        '--merge_qc',
+        help="Merge qc_summary.json files (or folders containing them) into catalog-wide histograms and exit",
+        nargs='+',
+        dest='merge_qc',
+        default=None
+    )
+
     parser.add_argument(
         '--test'
     )
@@ -126,9 +379,16 @@ def parse_arguments():
 
     args = parser.parse_args()
 
+    if args.output is None:
+        parser.error("-o/--output is required")
+    if args.rank is None and args.merge_qc is None:
+        parser.error("-r/--rank is required: one or more ranks, or 'all'")
+    if args.rank is not None:
+        args.rank = list(all_ranks) if "all" in args.rank else list(dict.fromkeys(args.rank))
+
     return args
 
-def load_dfs(coverm, checkm, checkm2, gtdb, drep):
+def load_dfs(coverm, checkm, checkm2, gtdb, drep, load_coverm=True):
     dfs = {}
     coverm_dfs = {}
 
@@ -164,7 +424,7 @@ def load_dfs(coverm, checkm, checkm2, gtdb, drep):
         dfs['gtdb'] = pd.read_csv(gtdb, index_col=0)
     print(f"[INFO] gtdb loaded: {dfs['gtdb'].shape} rows x columns")
 
-    for i, file in enumerate(os.listdir(coverm)):
+    for i, file in enumerate(os.listdir(coverm) if load_coverm else []):
         path = os.path.join(coverm, file)
         if file.endswith(".csv"):
             coverm_dfs[f'coverm_{i}'] = pd.read_csv(path, index_col=0)
@@ -209,6 +469,28 @@ def merged_coverm(coverm_dfs):
 
         return coverm_merged
 
+def is_archive(output_path):
+    return output_path.endswith((".zip", ".tar", ".tar.gz", ".tgz"))
+
+def coverm_state_path(output_path):
+    # the incremental state needs a real folder, next to the archive for archive outputs
+    if is_archive(output_path):
+        return f"{output_path}.coverm_state"
+    return os.path.join(output_path, ".coverm_state")
+
+def preview_path(output_path):
+    # previews never overwrite the plots of a full run
+    if is_archive(output_path):
+        base, ext = next((output_path[:-len(e)], e) for e in (".tar.gz", ".tgz", ".zip", ".tar") if output_path.endswith(e))
+        return f"{base}_preview{ext}"
+    return os.path.join(output_path, "preview")
+
+def preview_cache(output_path):
+    if get_cache() is not None:
+        return get_cache()
+    return TableCache(f"{output_path}.preview_cache" if is_archive(output_path)
+                      else os.path.join(output_path, ".preview_cache"))
+
 def check_path(output_path):
     if not os.path.exists(output_path):
         os.makedirs(output_path)
@@ -220,34 +502,117 @@ if __name__ == '__main__':
     start_time = time.time()
     args = parse_arguments()
 
-    dfs = load_dfs(args.coverm_path, args.checkm_file, args.checkm2_file, args.gtdb_file, args.drep_file)
-
-    dfs['coverm'] = merged_coverm(dfs['coverm'])
-
-    check_path(args.output)
-
-    generate_taxa_sanky(dfs['gtdb'], args.output)
-    taxa_sanky_rank(dfs['gtdb'], args.output, args.rank)
-
-    completeness_contamination_plot(dfs['checkm'], args.output)
-
-    species_level_plot(dfs['drep'], args.output)
-
-    mag_detection_heatmap(dfs["coverm"], args.output)
-
-    mag_heatmap(dfs["coverm"], dfs["gtdb"], args.output)
-
-    create_n50_histogram(dfs['checkm2'], args.output)
-    number_of_contigs(dfs["checkm2"], args.output)
-    create_assambly_info_histo(dfs["checkm2"], args.output)
-
-    rank_distribution_pie(dfs["gtdb"], args.output, args.rank, args.n)
-
-    if args.amber_file is not None:
-        binner_plot(load_single_df(args.amber_file), args.output)
+    if args.merge_qc is not None:
+        with open_sink(args.output, args.encode_workers) as output:
+            plot_qc_summary(merge_qc_summaries(load_qc_summaries(args.merge_qc)), output)
+        print(f'[INFO] Run time: {time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))}')
+        sys.exit(0)
+
+    if args.stream:
+        if not is_archive(args.output):
+            check_path(args.output)
+        with open_sink(args.output, args.encode_workers) as output:
+            stream_plots(args.gtdb_file, args.checkm_file, args.checkm2_file, output, args.rank[0], args.n,
+                         args.chunk_size, args.qc_summary, args.sankey_format)
+        print(f'[INFO] Run time: {time.strftime("%H:%M:%S", time.gmtime(time.time() - start_time))}')
+        sys.exit(0)
+
+    if args.cache_dir is not None:
+        set_cache(TableCache(args.cache_dir, int(args.cache_size * 2**20)))
+
+    if args.preview:
+        def load_full_dfs():
+            dfs = load_dfs(args.coverm_path, args.checkm_file, args.checkm2_file, args.gtdb_file, args.drep_file)
+            dfs['coverm'] = merged_coverm(dfs['coverm'])
+            return dfs
+
+        # the incremental state must only ever contain complete CoverM files
+        args.incremental = False
+        dfs, preview_summary = load_preview(
+            [args.gtdb_file, args.checkm_file, args.checkm2_file, args.drep_file, args.coverm_path],
+            load_full_dfs, preview_cache(args.output), args.preview_mags, args.preview_samples, args.preview_seed)
+        args.output = preview_path(args.output)
+    else:
+        dfs = load_dfs(args.coverm_path, args.checkm_file, args.checkm2_file, args.gtdb_file, args.drep_file,
+                       load_coverm=not args.incremental)
+
+        dfs['coverm'] = merged_coverm(dfs['coverm']) if not args.incremental else None
+
+    if not is_archive(args.output):
+        check_path(args.output)
+    # the with block finalizes archives and pending PNG encodes also when a plot fails
+    with open_sink(args.output, args.encode_workers) as output:
+        if args.preview:
+            output.watermark = "PREVIEW"
+            write_preview_note(preview_summary, output, args.preview_seed)
+
+        generate_taxa_sanky(dfs['gtdb'], output, args.sankey_format, args.sankey_max_nodes, args.sankey_max_links)
+        multi_rank = len(args.rank) > 1
+        if not multi_rank:
+            taxa_sanky_rank(dfs['gtdb'], output, args.rank[0], args.sankey_format, args.sankey_max_nodes,
+                            args.sankey_max_links)
+
+        completeness_contamination_plot(dfs['checkm'], output)
+
+        species_level_plot(dfs['drep'], output)
+        if args.drep_ndb_file is not None or args.drep_mdb_file is not None:
+            drep_ani_plots(dfs['drep'], output, args.drep_ndb_file, args.drep_mdb_file, args.chunk_size, args.n)
+
+        if args.incremental:
+            state = update_coverm_state(args.coverm_path, dfs["gtdb"], coverm_state_path(args.output),
+                                        rank=args.heatmap_rank)
+            heat, mags_per_taxon, mags_per_sample = state_heatmap_data(state)
+            print("[INFO] Incremental mode: skipping MAG detection heatmap, accumulation curves and co-occurrence network")
+        else:
+            mag_detection_heatmap(dfs["coverm"], output)
+            heat, mags_per_taxon, mags_per_sample = heatmap_data(dfs["coverm"], dfs["gtdb"], rank=args.heatmap_rank)
 
-    if args.gtdb_ar_file is not None and args.gtdb_bac_file is not None:
-        rank_completeness_contamination_plot(load_single_df(args.test), load_single_df(args.gtdb_bac_file), load_single_df(args.gtdb_ar_file), args.rank, args.output, args.n)
+        if args.heatmap_tiles:
+            heatmap_tile_pyramid(heat, output, rank=args.heatmap_rank)
+        else:
+            render_mag_heatmap(heat, mags_per_taxon, mags_per_sample, output, rank=args.heatmap_rank)
+
+        if not args.incremental:
+            sample_accumulation_plot(dfs["coverm"], output, dfs["gtdb"], args.rank[0], n_perm=args.permutations)
+            cooccurrence_network(dfs["coverm"], output, dfs["gtdb"], args.cooccurrence_rank,
+                                 top_k=args.top_k, min_jaccard=args.min_jaccard)
+
+        create_n50_histogram(dfs['checkm2'], output)
+        number_of_contigs(dfs["checkm2"], output)
+        create_assambly_info_histo(dfs["checkm2"], output)
+        if args.qc_summary:
+            write_qc_summary(dfs["checkm2"], output)
+
+        if not multi_rank:
+            rank_distribution_pie(dfs["gtdb"], output, args.rank[0], args.n)
+
+        if args.lineage:
+            lineage_plots(dfs["gtdb"], output, dfs["coverm"], args.lineage_depth, args.lineage_min_mags, args.lineage_values)
+
+        if args.dashboard:
+            write_dashboard(output, dfs["gtdb"], dfs["checkm"], dfs["checkm2"], dfs["drep"], dfs["coverm"], args.n,
+                            amber=load_single_df(args.amber_file) if args.amber_file is not None else None)
+
+        if args.amber_file is not None:
+            amber = load_single_df(args.amber_file)
+            binner_plot(amber, output)
+            binner_metrics_plot(amber, output, n_boot=args.bootstrap)
+
+        rank_tables = args.gtdb_ar_file is not None and args.gtdb_bac_file is not None
+        if multi_rank:
+            quality_inputs = {}
+            if rank_tables:
+                quality_inputs = dict(checkm=load_single_df(args.test), gtdb_bac=load_single_df(args.gtdb_bac_file),
+                                      gtdb_ar=load_single_df(args.gtdb_ar_file))
+            all_rank_plots(dfs["gtdb"], output, args.rank, args.n, **quality_inputs,
+                           sankey_formats=args.sankey_format, max_nodes=args.sankey_max_nodes,
+                           max_links=args.sankey_max_links, workers=args.rank_workers)
+        elif rank_tables:
+            rank_completeness_contamination_plot(load_single_df(args.test), load_single_df(args.gtdb_bac_file), load_single_df(args.gtdb_ar_file), args.rank[0], output, args.n)
+
+    if args.cache_dir is not None:
+        stats = get_cache().stats()
+        print(f"[INFO] Cache: {stats['hits']} hits, {stats['misses']} misses")
 
     end_time = time.time()
     print(f'[INFO] Run time: {time.strftime("%H:%M:%S", time.gmtime(end_time - start_time))}')
\ No newline at end of file
@@ -0,0 +1,81 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib.pyplot as plt
+import pandas as pd
+from sinks import MemorySink, save_bytes
+from cache import cached
+from lineage import LineageTrie
+from rank_dist_plot import plot_rank_distribution
+from sanky_taxa import rank_sankey
+from comp_conta_plot import plot_rank_completeness_contamination
+
+ranks = ["domain", "phylum", "class", "order", "family", "genus", "species"]
+
+def split_ranks(gtdb):
+    """GTDB classification split once into one column per rank (prefixed names like 'p__Bacteroidota')"""
+    table = gtdb["classification"].str.split(";", expand=True)
+    table.columns = ranks[:table.shape[1]]
+    return table.replace({"": None, " ": None})
+
+def rank_links(gtdb):
+    """
+    Genome -> taxon links of every rank in one grouped pass (rank, source,
+    target, count); the per-rank slices equal genome_links(gtdb, rank).
+    """
+    table = split_ranks(gtdb)
+    table.index = table.index.rename("source")
+    long = table.rename_axis(columns="rank").stack().dropna().rename("target").reset_index()
+    return long.groupby(["rank", "source", "target"], sort=False).size().reset_index(name="count")
+
+def rank_quality(checkm, gtdb_bac, gtdb_ar):
+    """CheckM completeness / contamination joined with the taxon names of every rank"""
+    checkm = checkm.copy()
+    checkm.index = checkm.index.str.replace('.', '_', regex=False)
+    taxa = split_ranks(pd.concat([gtdb_ar, gtdb_bac], ignore_index=False))
+    taxa = taxa.apply(lambda column: column.str.split("__").str[-1].str.strip())
+    taxa.columns = [rank.capitalize() for rank in taxa.columns]
+    return checkm[["Completeness", "Contamination"]].join(taxa)
+
+def render_rank(rank, counts, links, quality, n, sankey_formats, max_nodes, max_links, watermark=None):
+    """All per-rank figures of one rank, encoded in memory (name -> bytes)"""
+    sink = MemorySink(workers=0)
+    sink.watermark = watermark
+    plot_rank_distribution(counts, sink, rank, n, name=f"rank_dist_pie_{rank}.png")
+    rank_sankey(links, sink, rank, sankey_formats, max_nodes, max_links, name=f"sankey_plot_rank_filtered_{rank}")
+    if quality is not None:
+        plot_rank_completeness_contamination(quality, rank, sink, n, name=f"comp_conta_by_rank_{rank}.png")
+    plt.close("all")
+    return sink.results
+
+def all_rank_plots(gtdb, output_path, selected_ranks, n, checkm=None, gtdb_bac=None, gtdb_ar=None,
+                   sankey_formats=("html",), max_nodes=30, max_links=300, workers=4):
+    """
+    Rank Sankey, pie and (with the GTDB bac/ar tables) the colored CheckM scatter
+    for several ranks. The taxonomy is parsed once for all ranks (Sankey links in
+    one grouped pass, pie counts from a LineageTrie) and the figures
+    are rendered in worker processes, file names end with the rank.
+    """
+    links = cached("rank_links", [gtdb[["classification"]]], {}, lambda: rank_links(gtdb))
+    # pie counts of all ranks from one lineage trie traversal
+    trie = LineageTrie(gtdb["classification"])
+    quality = rank_quality(checkm, gtdb_bac, gtdb_ar) if checkm is not None else None
+    watermark = getattr(output_path, "watermark", None)
+
+    jobs = [(rank, trie.rank_counts(rank),
+             links.loc[links["rank"] == rank, ["source", "target", "count"]].reset_index(drop=True),
+             quality[["Completeness", "Contamination", rank.capitalize()]] if quality is not None else None,
+             n, sankey_formats, max_nodes, max_links, watermark) for rank in selected_ranks]
+
+    if workers > 1 and len(jobs) > 1:
+        # spawned, not forked: the output sink may have PNG encode threads running
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(render_rank, *zip(*jobs)))
+    else:
+        results = [render_rank(*job) for job in jobs]
+
+    for rank, files in zip(selected_ranks, results):
+        for name, data in files.items():
+            save_bytes(data, output_path, name)
+        print(f"[INFO] Rank plots written: {rank}")
+    return results
@@ -0,0 +1,124 @@
+import os
+import numpy as np
+import pandas as pd
+from heatmap import extract_taxon, normalize_id, clean_sample_label
+from comp_conta_plot import mimag_tier
+from sinks import save_bytes
+
+def canonical_ids(index):
+    """Genome IDs of any input (CheckM, CheckM2, GTDB, dRep, CoverM) in the GTDB form"""
+    return pd.Index([normalize_id(str(g)) for g in index])
+
+def hash_rank(values, seed=0):
+    """Seeded pseudo-random key per value; independent of row order and catalog size"""
+    return pd.util.hash_array(np.asarray(values, dtype=object), hash_key=f"{seed:016d}"[-16:])
+
+def preview_strata(gtdb, checkm, drep=None, coverm=None):
+    """
+    GTDB phylum x MIMAG tier of every genome found in any input; genomes only in
+    dRep or CoverM are 'Unclassified' / 'Unknown' so they are subsampled too
+    """
+    phylum = pd.Series(gtdb["classification"].map(lambda tax: extract_taxon(tax, "phylum")).to_numpy(),
+                       index=canonical_ids(gtdb.index))
+    tier = pd.Series(mimag_tier(checkm["Completeness"], checkm["Contamination"]).to_numpy(),
+                     index=canonical_ids(checkm.index))
+
+    genomes = phylum.index.union(tier.index)
+    if drep is not None:
+        genomes = genomes.union(canonical_ids(drep.index))
+    if coverm is not None:
+        genomes = genomes.union(canonical_ids(coverm.index.drop("unmapped", errors="ignore")))
+    genomes = genomes.drop_duplicates()
+    return pd.DataFrame({
+        "phylum": phylum[~phylum.index.duplicated()].reindex(genomes).replace("", None).fillna("Unclassified"),
+        "tier": tier[~tier.index.duplicated()].reindex(genomes).fillna("Unknown"),
+    }, index=genomes)
+
+def select_mags(strata, n_mags, seed=0):
+    """
+    Proportional stratified subsample of about n_mags genomes, at least one per
+    stratum so rare phyla / tiers stay visible. Within a stratum the genomes
+    with the smallest seeded hash are taken, so the selection is reproducible.
+    """
+    sizes = strata.groupby(["phylum", "tier"]).size().rename("genomes")
+    quota = np.minimum(sizes, np.maximum(1, np.round(sizes * n_mags / max(len(strata), 1)))).astype(int)
+
+    ranked = strata.assign(key=hash_rank(strata.index, seed)).sort_values(["phylum", "tier", "key"])
+    position = ranked.groupby(["phylum", "tier"]).cumcount()
+    allowed = quota.reindex(pd.MultiIndex.from_frame(ranked[["phylum", "tier"]])).to_numpy()
+    selected = ranked.index[position.to_numpy() < allowed]
+
+    summary = pd.concat([sizes, quota.rename("selected")], axis=1).reset_index()
+    return selected, summary
+
+def select_samples(columns, n_samples, seed=0):
+    """The n_samples CoverM columns with the smallest seeded hash, in their original order"""
+    if len(columns) <= n_samples:
+        return list(columns)
+    keys = hash_rank([clean_sample_label(str(c)) for c in columns], seed)
+    keep = np.zeros(len(columns), dtype=bool)
+    keep[np.argsort(keys, kind="stable")[:n_samples]] = True
+    return [c for c, k in zip(columns, keep) if k]
+
+def subsample_dfs(dfs, n_mags, n_samples, seed=0):
+    """All input tables reduced to the same stratified MAG subsample (and CoverM samples)"""
+    strata = preview_strata(dfs["gtdb"], dfs["checkm"], dfs["drep"], dfs["coverm"])
+    selected, summary = select_mags(strata, n_mags, seed)
+
+    preview = {}
+    for name in ("gtdb", "checkm", "checkm2", "drep"):
+        df = dfs[name]
+        preview[name] = df[canonical_ids(df.index).isin(selected)]
+
+    coverm = dfs["coverm"]
+    keep_rows = canonical_ids(coverm.index).isin(selected) | (coverm.index == "unmapped")
+    preview["coverm"] = coverm.loc[keep_rows, select_samples(coverm.columns, n_samples, seed)]
+
+    summary.attrs["samples"] = (preview["coverm"].shape[1], coverm.shape[1])
+    return preview, summary
+
+def file_fingerprints(paths):
+    """Path, size and mtime of every input file; a changed input invalidates the cached preview"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, f) for f in os.listdir(path))
+        else:
+            files.append(path)
+    stats = [os.stat(f) for f in files]
+    return pd.DataFrame({"path": [os.path.abspath(f) for f in files],
+                         "size": [s.st_size for s in stats],
+                         "mtime_ns": [s.st_mtime_ns for s in stats]})
+
+def load_preview(paths, load, cache, n_mags=2000, n_samples=20, seed=0):
+    """
+    Preview tables for the input files in paths. load() reads and merges the full
+    inputs (dict like load_dfs); it only runs when no preview of these exact files
+    and parameters is cached.
+    """
+    names = ("gtdb", "checkm", "checkm2", "drep", "coverm")
+
+    def compute():
+        preview, summary = subsample_dfs(load(), n_mags, n_samples, seed)
+        summary["samples_selected"], summary["samples_total"] = summary.attrs["samples"]
+        return tuple(preview[name] for name in names) + (summary,)
+
+    # "strata" keeps cached previews stratified on GTDB / CheckM genomes only from being reused
+    tables = cache.get_or_compute("preview", [file_fingerprints(paths)],
+                                  {"n_mags": n_mags, "n_samples": n_samples, "seed": seed,
+                                   "strata": "all_inputs"}, compute)
+    dfs = dict(zip(names, tables[:-1]))
+    summary = tables[-1]
+
+    print(f"[INFO] Preview: {summary['selected'].sum()} of {summary['genomes'].sum()} MAGs "
+          f"from {len(summary)} phylum x tier strata, "
+          f"{summary['samples_selected'].iloc[0]} of {summary['samples_total'].iloc[0]} samples")
+    return dfs, summary
+
+def write_preview_note(summary, output_path, seed=0):
+    """PREVIEW.txt next to the plots so a preview is never mistaken for a full run"""
+    note = (f"PREVIEW - plots drawn from a stratified subsample (seed {seed}), not the full project.\n"
+            f"{summary['selected'].sum()} of {summary['genomes'].sum()} MAGs, "
+            f"{summary['samples_selected'].iloc[0]} of {summary['samples_total'].iloc[0]} CoverM samples.\n\n"
+            + summary.drop(columns=["samples_selected", "samples_total"]).to_string(index=False) + "\n")
+    return save_bytes(note.encode("utf-8"), output_path, "PREVIEW.txt")
@@ -0,0 +1,201 @@
+import json
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from sinks import save_figure, save_bytes
+
+SUMMARY_VERSION = 1
+
+# CheckM2 column -> (label, fixed bin edges); identical edges make histograms of different runs addable
+qc_metrics = {
+    "Contig_N50": ("N50 (bp)", np.logspace(2, 7, 101)),
+    "Total_Contigs": ("Number of contigs", np.logspace(0, 5, 101)),
+    "Genome_Size": ("Total length Assembly (bp)", np.logspace(5, 8, 91)),
+    "Max_Contig_Length": ("Longest Contig (bp)", np.logspace(3, 8, 101)),
+    "Coding_Density": ("Coding Density", np.linspace(0, 1, 101)),
+}
+
+class QuantileDigest:
+    """
+    Mergeable quantile sketch (t-digest with the arcsine scale function).
+    Values are kept as weighted centroids; centroids near the tails stay small,
+    so extreme quantiles remain accurate while the size is bounded by ~compression.
+    """
+
+    def __init__(self, compression=200, means=None, weights=None):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        self._compress(np.r_[self.means, values], np.r_[self.weights, np.ones(len(values))])
+        return self
+
+    def merge(self, other):
+        self._compress(np.r_[self.means, other.means], np.r_[self.weights, other.weights])
+        return self
+
+    def _compress(self, means, weights):
+        if len(means) == 0:
+            self.means, self.weights = means, weights
+            return
+
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+
+        # centroid id = integer part of the scale function at each point's quantile
+        cum = np.cumsum(weights)
+        q = (cum - weights / 2) / cum[-1]
+        k = np.floor(self.compression / np.pi * np.arcsin(2 * q - 1)).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        if len(self.means) == 0:
+            return np.full(np.shape(q), np.nan)
+        cum = np.cumsum(self.weights)
+        centers = (cum - self.weights / 2) / cum[-1]
+        return np.interp(q, centers, self.means)
+
+    def to_dict(self):
+        return {"compression": self.compression, "means": self.means.tolist(), "weights": self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["compression"], d["means"], d["weights"])
+
+def summarize_values(values, edges, compression=200):
+    """Fixed-bin histogram, min/max and quantile digest of one metric"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    counts, _ = np.histogram(values, bins=edges)
+
+    return {
+        "edges": np.asarray(edges).tolist(),
+        "counts": counts.tolist(),
+        "underflow": int((values < edges[0]).sum()),
+        "overflow": int((values > edges[-1]).sum()),
+        "n": int(len(values)),
+        "min": float(values.min()) if len(values) else None,
+        "max": float(values.max()) if len(values) else None,
+        "digest": QuantileDigest(compression).update(values).to_dict(),
+    }
+
+def checkm2_summary(checkm2, run_name=None):
+    """Summary of the CheckM2 assembly metrics that can be stored and merged across runs"""
+    metrics = {}
+    for column, (_, edges) in qc_metrics.items():
+        if column in checkm2.columns:
+            metrics[column] = summarize_values(checkm2[column], edges)
+
+    return {"version": SUMMARY_VERSION, "runs": [run_name] if run_name else [],
+            "n_genomes": int(len(checkm2)), "metrics": metrics}
+
+def _merge_extreme(fn, a, b):
+    values = [v for v in (a, b) if v is not None]
+    return fn(values) if values else None
+
+def merge_qc_summaries(summaries):
+    """Add up the histograms and merge the digests of several summaries"""
+    merged = {"version": SUMMARY_VERSION, "runs": [], "n_genomes": 0, "metrics": {}}
+
+    for summary in summaries:
+        if summary.get("version") != SUMMARY_VERSION:
+            raise ValueError(f"Unsupported QC summary version: {summary.get('version')}")
+        merged["runs"] += summary["runs"]
+        merged["n_genomes"] += summary["n_genomes"]
+
+        for column, m in summary["metrics"].items():
+            if column not in merged["metrics"]:
+                merged["metrics"][column] = dict(m, counts=list(m["counts"]))
+                continue
+
+            acc = merged["metrics"][column]
+            if not np.allclose(acc["edges"], m["edges"]):
+                raise ValueError(f"QC summaries use different bins for '{column}'")
+
+            acc["counts"] = (np.asarray(acc["counts"]) + np.asarray(m["counts"])).tolist()
+            for key in ("underflow", "overflow", "n"):
+                acc[key] += m[key]
+            acc["min"] = _merge_extreme(min, acc["min"], m["min"])
+            acc["max"] = _merge_extreme(max, acc["max"], m["max"])
+            acc["digest"] = (QuantileDigest.from_dict(acc["digest"])
+                             .merge(QuantileDigest.from_dict(m["digest"])).to_dict())
+
+    return merged
+
+def write_qc_summary(checkm2, output_path, run_name=None):
+    """Save the CheckM2 summary as a small JSON sidecar file"""
+    location = getattr(output_path, "location", output_path)
+    if run_name is None and location is not None:
+        run_name = os.path.basename(os.path.normpath(location))
+
+    summary = checkm2_summary(checkm2, run_name)
+    save_bytes(json.dumps(summary).encode("utf-8"), output_path, "qc_summary.json")
+    print("[INFO] Saved: qc_summary.json")
+    return summary
+
+def load_qc_summaries(paths):
+    """
+    Load sidecar files; directories are searched recursively for qc_summary.json.
+    A file reached through several paths is loaded once.
+    """
+    summaries = []
+    seen_files, seen_runs = set(), set()
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(root, f) for root, _, names in os.walk(path)
+                     for f in names if f == "qc_summary.json"]
+        else:
+            files = [path]
+        for file in sorted(files):
+            resolved = os.path.realpath(file)
+            if resolved in seen_files:
+                continue
+            seen_files.add(resolved)
+            with open(file) as f:
+                summary = json.load(f)
+            for run in summary.get("runs", []):
+                if run in seen_runs:
+                    print(f"[INFO] Run '{run}' is in more than one QC summary ({file}), its genomes are counted twice")
+                seen_runs.add(run)
+            summaries.append(summary)
+    print(f"[INFO] {len(summaries)} QC summaries loaded")
+    return summaries
+
+def plot_qc_summary(summary, output_path):
+    """Catalog-wide distribution of every summarized metric, with quartiles from the digests"""
+    metrics = [c for c in qc_metrics if c in summary["metrics"]]
+
+    fig, axes = plt.subplots(2, 3, figsize=(15, 8))
+    axes = axes.flatten()
+
+    for ax, column in zip(axes, metrics):
+        m = summary["metrics"][column]
+        label, _ = qc_metrics[column]
+        edges = np.asarray(m["edges"])
+
+        ax.stairs(m["counts"], edges, fill=True, color="skyblue", edgecolor="black")
+        quartiles = QuantileDigest.from_dict(m["digest"]).quantile([0.25, 0.5, 0.75])
+        for q, style in zip(quartiles, (":", "--", ":")):
+            ax.axvline(q, color="#b64a4a", linestyle=style, linewidth=1.2)
+
+        if edges[0] > 0 and edges[-1] / edges[0] > 100:
+            ax.set_xscale("log")
+        filled = np.flatnonzero(m["counts"])
+        if len(filled):
+            ax.set_xlim(edges[filled[0]], edges[filled[-1] + 1])
+        ax.set_title(f"Distribution of {label}\nmedian {quartiles[1]:.3g}")
+        ax.set_xlabel(label)
+        ax.set_ylabel("Count")
+
+    for ax in axes[len(metrics):]:
+        ax.axis("off")
+
+    fig.suptitle(f"{summary['n_genomes']} genomes from {len(summary['runs'])} runs")
+    plt.tight_layout()
+    return save_figure(fig, output_path, "qc_summary_histograms.png")
@@ -1,38 +1,24 @@
 import matplotlib.pyplot as plt
-import os
+from sinks import save_figure
+from cache import cached
+from lineage import LineageTrie
 
-prefix_map = {
-    'domain': ('d', 0),
-    'phylum': ('p', 1),
-    'class': ('c', 2),
-    'order': ('o', 3),
-    'family': ('f', 4),
-    'genus': ('g', 5),
-    'species': ('s', 6),
-}
+def rank_counts(gtdb, rank):
+    """Number of MAGs per taxon of a rank, unclassified ones as 'Unknow <Rank>'"""
+    return LineageTrie(gtdb["classification"]).rank_counts(rank)
 
 def rank_distribution_pie(gtdb, output_path, rank, n):
-    df = gtdb.reset_index().loc[:,['user_genome', 'classification']]
+    counts = cached("rank_counts", [gtdb[["classification"]]], {"rank": rank},
+                    lambda: rank_counts(gtdb, rank))
+    return plot_rank_distribution(counts, output_path, rank, n)
 
-    df.rename(columns={'user_genome': 'Bin', 'classification': f'{rank.capitalize()}'}, inplace=True)
+def plot_rank_distribution(counts, output_path, rank, n, name="rank_dist_pie.png"):
+    """Pie of the n most frequent taxa from rank_counts"""
+    top_counts = counts.head(n)
 
-    taxa_level, pos = prefix_map.get(rank, ("taxa",-1))
-    df[f'{rank.capitalize()}'] = (
-        df[f'{rank.capitalize()}']
-        .str.split(';')
-        .str[pos]
-        .str.replace(f'{taxa_level}__', '', regex=False)
-    )
-
-    df[f'{rank.capitalize()}'] = df[f'{rank.capitalize()}'].replace('', f'Unknow {rank.capitalize()}')
-
-    rank_counts = df[f'{rank.capitalize()}'].value_counts()
-
-    top_counts = rank_counts.head(n)
-
-    plt.figure(figsize=(8,8))
+    fig = plt.figure(figsize=(8,8))
     top_counts.plot(kind="pie", autopct='%1.1f%%')
     plt.ylabel("")
     plt.title(f"{rank.capitalize()}-level distribution of MAGs")
 
-    plt.savefig(os.path.join(output_path, "rank_dist_pie.png"))
\ No newline at end of file
+    return save_figure(fig, output_path, name)
\ No newline at end of file
@@ -0,0 +1,74 @@
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+from sinks import save_figure, save_bytes
+from bitsets import pack_rows, popcount, presence_matrix
+from heatmap import normalize_id
+from comp_conta_plot import extract_rank
+
+def taxon_presence(presence, genomes, gtdb, rank):
+    """Collapse a MAG x sample detection matrix to taxon x sample (detected if any MAG is)"""
+    taxa = (pd.Series([normalize_id(str(g)) for g in genomes])
+            .map(gtdb["classification"])
+            .map(lambda x: extract_rank(x, rank) if isinstance(x, str) else None)
+            .replace("", None))
+
+    codes, names = pd.factorize(taxa)
+    keep = codes >= 0
+    order = np.argsort(codes[keep], kind="stable")
+    sorted_codes = codes[keep][order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+
+    if len(starts) == 0:
+        return np.zeros((0, presence.shape[1]), dtype=bool), names
+
+    return np.logical_or.reduceat(presence[keep][order], starts, axis=0), names
+
+def accumulation_curve(presence, n_perm=100, seed=0):
+    """
+    Random-order sample accumulation of a feature x sample detection matrix.
+    Every sample is stored as a packed bitset over the features, so adding a
+    sample is a bitwise OR and counting the detected features a popcount.
+    """
+    n_samples = presence.shape[1]
+    packed = pack_rows(presence.T)
+    rng = np.random.default_rng(seed)
+
+    detected = np.empty((n_perm, n_samples), dtype=np.int64)
+    for i in range(n_perm):
+        order = rng.permutation(n_samples)
+        detected[i] = popcount(np.bitwise_or.accumulate(packed[order], axis=0))
+
+    return pd.DataFrame({
+        "n_samples": np.arange(1, n_samples + 1),
+        "mean": detected.mean(axis=0),
+        "std": detected.std(axis=0),
+        "lower": np.percentile(detected, 2.5, axis=0),
+        "upper": np.percentile(detected, 97.5, axis=0),
+    })
+
+def sample_accumulation_plot(coverm, output_path, gtdb=None, rank=None,
+                             present_threshold=0.0, n_perm=100, seed=0):
+    """MAG (and taxon) discovery curves over the number of sequenced samples"""
+    presence, genomes, _ = presence_matrix(coverm, present_threshold)
+
+    curves = {"MAGs": accumulation_curve(presence, n_perm, seed)}
+    if gtdb is not None and rank is not None:
+        taxa, _ = taxon_presence(presence, genomes, gtdb, rank)
+        curves[rank.capitalize()] = accumulation_curve(taxa, n_perm, seed)
+
+    results = pd.concat(curves, names=["level"]).reset_index(level=0)
+    save_bytes(results.to_csv(index=False).encode("utf-8"), output_path, "sample_accumulation_curve.csv")
+
+    fig, axes = plt.subplots(1, len(curves), figsize=(7 * len(curves), 5), squeeze=False)
+    for ax, (level, curve) in zip(axes[0], curves.items()):
+        ax.plot(curve["n_samples"], curve["mean"], color="black", label=f"Mean detected {level}")
+        ax.fill_between(curve["n_samples"], curve["lower"], curve["upper"],
+                        color="gray", alpha=0.3, label="95% interval")
+        ax.set_xlabel("Number of samples")
+        ax.set_ylabel(f"Number of detected {level}")
+        ax.set_title(f"{level} accumulation ({n_perm} permutations)")
+        ax.legend()
+
+    plt.tight_layout()
+    return save_figure(fig, output_path, "sample_accumulation_curve.png")
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection
+
+def cap_sankey(labels, colors, levels, source, target, value, max_nodes=30, max_links=300):
+    """
+    Merge the smallest nodes of every column into one "Other (k)" node and keep
+    only the max_links largest links, so the figure stays legible. Returns the
+    reduced (labels, colors, levels, links) with links as a source/target/value frame.
+    """
+    labels, colors, levels = list(labels), list(colors), list(levels)
+    n = len(labels)
+    size = np.maximum(np.bincount(source, value, n), np.bincount(target, value, n))
+
+    remap = np.arange(n)
+    level_array = np.asarray(levels)
+    for level in np.unique(level_array):
+        members = np.flatnonzero(level_array == level)
+        if len(members) <= max_nodes:
+            continue
+        dropped = members[np.argsort(-size[members], kind="stable")][max_nodes - 1:]
+        remap[dropped] = len(labels)
+        labels.append(f"Other ({len(dropped)})")
+        colors.append("lightgray")
+        levels.append(level)
+
+    links = (pd.DataFrame({"source": remap[source], "target": remap[target], "value": value})
+             .groupby(["source", "target"], as_index=False)["value"].sum()
+             .nlargest(max_links, "value", keep="first"))
+
+    # renumber the nodes that still have a link
+    used = np.unique(np.r_[links["source"], links["target"]])
+    new_id = np.full(len(labels), -1)
+    new_id[used] = np.arange(len(used))
+    links["source"], links["target"] = new_id[links["source"]], new_id[links["target"]]
+
+    pick = lambda values: [values[i] for i in used]
+    return pick(labels), pick(colors), np.asarray(pick(levels)), links.reset_index(drop=True)
+
+def sankey_layout(levels, links, gap=0.02):
+    """
+    Node x (column) / y (top) / height and link band offsets. Columns are ordered
+    by size, then every column by the mean position of its incoming links and
+    once back by the mean position of its outgoing links, to reduce crossings.
+    """
+    n = len(levels)
+    source, target, value = (links[c].to_numpy() for c in ("source", "target", "value"))
+    size = np.maximum(np.bincount(source, value, n), np.bincount(target, value, n))
+
+    columns = np.unique(levels)
+    x = np.searchsorted(columns, levels).astype(float)
+    counts = np.bincount(x.astype(int))
+    gap = min(gap, 0.5 / max(counts.max() - 1, 1))
+    totals = np.bincount(x.astype(int), size)
+    scale = ((1 - gap * (counts - 1)) / totals).min()
+    height = size * scale
+
+    order_key = -size.astype(float)
+    y = np.zeros(n)
+
+    def place(column):
+        members = np.flatnonzero(x == column)
+        members = members[np.argsort(order_key[members], kind="stable")]
+        y[members] = np.r_[0, np.cumsum(height[members] + gap)[:-1]]
+
+    def barycenter(nodes_from, nodes_to):
+        centers = y[nodes_from] + height[nodes_from] / 2
+        weight = np.bincount(nodes_to, value, n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.bincount(nodes_to, value * centers, n) / weight
+
+    place(0)
+    for column in range(1, len(columns)):
+        members = x == column
+        order_key[members] = np.nan_to_num(barycenter(source, target)[members], nan=np.inf)
+        place(column)
+    for column in range(len(columns) - 2, -1, -1):
+        members = x == column
+        key = barycenter(target, source)[members]
+        order_key[members] = np.where(np.isnan(key), np.inf, key)
+        place(column)
+
+    # each link takes the next slice of its source's outflow and its target's inflow
+    width = value * scale
+    frame = pd.DataFrame({"source": source, "target": target, "width": width,
+                          "source_y": y[source], "target_y": y[target]})
+    out_offset = (frame.sort_values(["source", "target_y"]).groupby("source")["width"].cumsum() - frame["width"])
+    in_offset = (frame.sort_values(["target", "source_y"]).groupby("target")["width"].cumsum() - frame["width"])
+
+    return x, y, height, y[source] + out_offset.sort_index().to_numpy(), \
+        y[target] + in_offset.sort_index().to_numpy(), width
+
+def static_sankey(labels, colors, levels, source, target, value, title=None,
+                  column_names=None, max_nodes=30, max_links=300, node_width=0.06, resolution=32):
+    """
+    Sankey diagram as a matplotlib figure (PNG/SVG/PDF without a browser).
+    levels gives the column of every node; all link bands are built at once as
+    smoothstep curves in one PolyCollection.
+    """
+    labels, colors, levels, links = cap_sankey(labels, colors, levels, np.asarray(source),
+                                               np.asarray(target), np.asarray(value, dtype=float),
+                                               max_nodes, max_links)
+    x, y, height, band_source, band_target, width = sankey_layout(levels, links)
+
+    x0 = x[links["source"].to_numpy()] + node_width
+    x1 = x[links["target"].to_numpy()]
+    t = np.linspace(0, 1, resolution)
+    smooth = 3 * t ** 2 - 2 * t ** 3
+    band_x = x0[:, None] + (x1 - x0)[:, None] * t
+    top = band_source[:, None] + (band_target - band_source)[:, None] * smooth
+    bottom = top + width[:, None]
+    verts = np.concatenate([np.stack([band_x, top], axis=-1),
+                            np.stack([band_x[:, ::-1], bottom[:, ::-1]], axis=-1)], axis=1)
+
+    n_columns = int(x.max()) + 1
+    tallest = np.bincount(x.astype(int)).max()
+    fig, ax = plt.subplots(figsize=(3 * n_columns + 2, max(6, 0.28 * tallest)))
+    ax.add_collection(PolyCollection(verts, facecolors=[colors[s] for s in links["source"]],
+                                     alpha=0.35, edgecolors="none"))
+    ax.bar(x + node_width / 2, height, width=node_width, bottom=y, color=colors,
+           edgecolor="black", linewidth=0.5)
+
+    fontsize = 8 if tallest <= 30 else 6
+    for xi, yi, hi, label in zip(x, y, height, labels):
+        ax.text(xi + node_width * 1.3, yi + hi / 2, label, va="center", fontsize=fontsize)
+
+    if column_names is not None:
+        for i, name in enumerate(column_names[:n_columns]):
+            ax.text(i + node_width / 2, -0.02, name, ha="center", va="bottom", fontsize=10, weight="bold")
+
+    ax.set_xlim(-0.1, n_columns - 1 + 0.9)
+    ax.set_ylim(max(1.0, (y + height).max()) + 0.01, -0.05)
+    ax.axis("off")
+    if title:
+        ax.set_title(title, fontsize=14, weight="bold")
+    plt.tight_layout()
+    return fig
@@ -1,7 +1,9 @@
 import pandas as pd
 import plotly.graph_objects as go
-import os
 import re
+from sinks import save_html, save_figure
+from cache import cached
+from sankey_static import static_sankey
 
 prefix_map = {
     "d": "domain",
@@ -13,7 +15,8 @@ prefix_map = {
     "s": "species"
 }
 
-def generate_taxa_sanky(gtdb, output_path):
+def taxa_links(gtdb):
+    """MAG counts of all (rank, next rank) taxon pairs along the GTDB lineages"""
     tax_split = gtdb["classification"].str.split(";", expand=True)
     tax_split.columns = ["domain", "phylum", "class", "order", "family", "genus", "species"]
 
@@ -30,7 +33,27 @@ def generate_taxa_sanky(gtdb, output_path):
         pairs.columns = ["source", "target", "count"]
         links.append(pairs)
 
-    links_df = pd.concat(links, ignore_index=True)
+    return pd.concat(links, ignore_index=True)
+
+def save_sankey(fig, output_path, name, formats, static):
+    """
+    Interactive HTML and/or static images of one Sankey. static() builds the
+    matplotlib version and only runs when an image format is requested.
+    """
+    if "html" in formats:
+        save_html(fig, output_path, f"{name}.html")
+    for fmt in formats:
+        if fmt != "html":
+            save_figure(static(), output_path, f"{name}.{fmt}")
+    return fig
+
+def generate_taxa_sanky(gtdb, output_path, formats=("html",), max_nodes=30, max_links=300):
+    links_df = cached("taxa_links", [gtdb[["classification"]]], {}, lambda: taxa_links(gtdb))
+    return taxa_sankey(links_df, output_path, formats, max_nodes, max_links)
+
+def taxa_sankey(links_df, output_path, formats=("html",), max_nodes=30, max_links=300):
+    """Sankey over all ranks from the pair counts of taxa_links"""
+    links_df = links_df.copy()
 
     nodes = pd.Index(pd.concat([links_df["source"], links_df["target"]]).unique())
     node_map = {name: i for i, name in enumerate(nodes)}
@@ -48,16 +71,8 @@ def generate_taxa_sanky(gtdb, output_path):
         "species": "#e377c2"   # pink
     }
 
-    node_colors = []
-    for node in nodes:
-        assigned = False
-        for rank in tax_split.columns:
-            if node in tax_split[rank].values:
-                node_colors.append(rank_colors[rank])
-                assigned = True
-                break
-        if not assigned:
-            node_colors.append("lightgray")
+    # GTDB names carry their rank as prefix ("p__..."), so the color needs no lookup
+    node_colors = [rank_colors.get(prefix_map.get(node.split("__")[0]), "lightgray") for node in nodes]
 
     clean_labels = []
     for label in nodes:
@@ -93,13 +108,19 @@ def generate_taxa_sanky(gtdb, output_path):
         height=900
     )
 
-    fig.write_html(os.path.join(output_path,"sankey_plot.html"))
-    
-    
-    #fig.write_image(os.path.join(output_path,"sankey_plot.png")) --> Possible but there are a lot of libraries needed to make this work so if this is wanted i can add them all as requirements
-
-def taxa_sanky_rank(gtdb, output_path, rank):
-
+    # one column per rank, taken from the prefix like the colors
+    prefixes = list(prefix_map)
+    levels = [prefixes.index(p) if p in prefix_map else len(prefixes) for p in nodes.str.split("__").str[0]]
+    static = lambda: static_sankey(clean_labels, node_colors, levels, links_df["source_idx"],
+                                   links_df["target_idx"], links_df["count"],
+                                   title="Taxonomic Classification Sankey",
+                                   column_names=[prefix_map[prefixes[i]].capitalize() for i in sorted(set(levels))
+                                                 if i < len(prefixes)],
+                                   max_nodes=max_nodes, max_links=max_links)
+    return save_sankey(fig, output_path, "sankey_plot", formats, static)
+
+def genome_links(gtdb, rank):
+    """One link per MAG to its taxon of the given rank"""
     tax_split = gtdb.reset_index()["classification"].str.split(";", expand=True)
     tax_split.columns = ["domain", "phylum", "class", "order", "family", "genus", "species"]
     tax_split = tax_split.replace({"": None, " ": None})
@@ -109,6 +130,17 @@ def taxa_sanky_rank(gtdb, output_path, rank):
 
     links_df = df_sankey.groupby(["user_genome", rank]).size().reset_index(name="count")
     links_df.columns = ["source", "target", "count"]
+    return links_df
+
+def taxa_sanky_rank(gtdb, output_path, rank, formats=("html",), max_nodes=30, max_links=300):
+    links_df = cached("genome_links", [gtdb[["classification"]]], {"rank": rank},
+                      lambda: genome_links(gtdb, rank))
+    return rank_sankey(links_df, output_path, rank, formats, max_nodes, max_links)
+
+def rank_sankey(links_df, output_path, rank, formats=("html",), max_nodes=30, max_links=300,
+                name="sankey_plot_rank_filtered"):
+    """Genome -> taxon Sankey from the links of genome_links"""
+    links_df = links_df.copy()
 
     nodes = pd.Index(pd.concat([links_df["source"], links_df["target"]]).unique())
     node_map = {name: i for i, name in enumerate(nodes)}
@@ -126,9 +158,10 @@ def taxa_sanky_rank(gtdb, output_path, rank):
         "species": "#e377c2"
     }
 
+    genomes = set(links_df["source"])
     node_colors = []
     for node in nodes:
-        if node in df_sankey["user_genome"].values:
+        if node in genomes:
             node_colors.append(rank_colors["genome"])
         else:
             node_colors.append(rank_colors.get(rank, "lightgray"))
@@ -164,4 +197,10 @@ def taxa_sanky_rank(gtdb, output_path, rank):
         height=800
     )
 
-    fig.write_html(os.path.join(output_path,"sankey_plot_rank_filtered.html"))
\ No newline at end of file
+    levels = [0 if node in genomes else 1 for node in nodes]
+    static = lambda: static_sankey(clean_labels, node_colors, levels, links_df["source_idx"],
+                                   links_df["target_idx"], links_df["count"],
+                                   title=f"Genome → {rank.capitalize()} Sankey",
+                                   column_names=["Genome", rank.capitalize()],
+                                   max_nodes=max_nodes, max_links=max_links)
+    return save_sankey(fig, output_path, name, formats, static)
\ No newline at end of file
@@ -0,0 +1,191 @@
+import io
+import os
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import matplotlib.pyplot as plt
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+class OutputSink:
+    """
+    Destination of every rendered output (PNG, HTML, CSV, ...), addressed by a
+    relative name like "heatmap_tiles/index.html". PNGs are compressed on a
+    background thread pool, so the next plot is computed while the previous one
+    is still being encoded. Use as a context manager or call close().
+    """
+
+    location = None
+    # e.g. "PREVIEW": stamped on every figure so partial results are recognisable
+    watermark = None
+
+    def __init__(self, workers=1):
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers else None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def write_bytes(self, name, data):
+        if self.watermark and name.endswith(".html"):
+            data = self._html_banner(data)
+        with self._lock:
+            self._write(name, data)
+
+    def _html_banner(self, data):
+        """Watermark as a fixed banner at the top of HTML pages (plotly, dashboard, tile viewer)"""
+        banner = (f'<div style="position:fixed;top:0;left:0;right:0;z-index:10000;padding:4px;'
+                  f'background:#b22222;color:white;font:bold 14px sans-serif;text-align:center">'
+                  f'{self.watermark}</div>').encode("utf-8")
+        head, body, rest = data.partition(b"<body>")
+        return head + body + banner + rest if body else banner + data
+
+    def _write(self, name, data):
+        raise NotImplementedError
+
+    def save_figure(self, fig, name, **savefig_kwargs):
+        """
+        Encode a matplotlib figure; the format follows the file extension.
+        The figure is always drawn in the calling thread (drawing reads the global
+        rcParams); for PNGs only the zlib compression runs on the background pool.
+        """
+        fmt = os.path.splitext(name)[1][1:].lower()
+        buf = io.BytesIO()
+        if self.watermark:
+            fig.text(0.5, 0.5, self.watermark, transform=fig.transFigure, fontsize=60, color="gray",
+                     alpha=0.25, rotation=30, ha="center", va="center", zorder=1000)
+
+        if fmt == "png" and self._pool is not None:
+            pil_kwargs = dict(savefig_kwargs.pop("pil_kwargs", {}), compress_level=0)
+            fig.savefig(buf, format="png", pil_kwargs=pil_kwargs, **savefig_kwargs)
+            plt.close(fig)
+            self._pending.append(self._pool.submit(self._compress_png, name, buf.getvalue()))
+            return
+
+        fig.savefig(buf, format=fmt, **savefig_kwargs)
+        plt.close(fig)
+        self.write_bytes(name, buf.getvalue())
+
+    def _compress_png(self, name, raw_png):
+        image = Image.open(io.BytesIO(raw_png))
+        info = PngInfo()
+        for key, value in image.text.items():
+            info.add_text(key, value)
+
+        out = io.BytesIO()
+        image.save(out, format="png", dpi=image.info.get("dpi", (72, 72)), pnginfo=info)
+        self.write_bytes(name, out.getvalue())
+
+    def save_html(self, fig, name, **to_html_kwargs):
+        """Write a plotly figure as standalone HTML"""
+        if self.watermark:
+            title = fig.layout.title.text
+            fig.update_layout(title_text=f"{self.watermark}: {title}" if title else self.watermark)
+        self.write_bytes(name, fig.to_html(**to_html_kwargs).encode("utf-8"))
+
+    def flush(self):
+        """Wait for all background encodings; re-raises the first error"""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class DirectorySink(OutputSink):
+    """Every output is a file below a folder"""
+
+    def __init__(self, path, workers=1):
+        super().__init__(workers)
+        self.location = path
+        os.makedirs(path, exist_ok=True)
+
+    def _write(self, name, data):
+        out = os.path.join(self.location, name)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "wb") as f:
+            f.write(data)
+
+class ZipSink(OutputSink):
+    """All outputs streamed into one zip archive (already compressed formats are stored)"""
+
+    def __init__(self, path, workers=1):
+        super().__init__(workers)
+        self.location = path
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def _write(self, name, data):
+        stored = os.path.splitext(name)[1].lower() in (".png", ".parquet", ".gz")
+        self._zip.writestr(name, data, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+
+    def close(self):
+        super().close()
+        self._zip.close()
+
+class TarSink(OutputSink):
+    """All outputs streamed into one (optionally gzipped) tar archive"""
+
+    def __init__(self, path, workers=1):
+        super().__init__(workers)
+        self.location = path
+        self._tar = tarfile.open(path, "w:gz" if path.endswith((".tar.gz", ".tgz")) else "w")
+
+    def _write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        super().close()
+        self._tar.close()
+
+class MemorySink(OutputSink):
+    """Keeps the encoded outputs in a dict (name -> bytes), e.g. for embedding in services"""
+
+    def __init__(self, workers=1):
+        super().__init__(workers)
+        self.results = {}
+
+    def _write(self, name, data):
+        self.results[name] = data
+
+def open_sink(output, workers=1):
+    """Sink for an output path: .zip / .tar / .tar.gz archives, otherwise a folder"""
+    if isinstance(output, OutputSink):
+        return output
+    if output.endswith(".zip"):
+        return ZipSink(output, workers)
+    if output.endswith((".tar", ".tar.gz", ".tgz")):
+        return TarSink(output, workers)
+    return DirectorySink(output, workers)
+
+def _as_sink(output):
+    # plain folder paths keep the old behaviour: written synchronously before returning
+    return output if isinstance(output, OutputSink) else DirectorySink(output, workers=0)
+
+def save_figure(fig, output, name, **savefig_kwargs):
+    """Save a matplotlib figure to a sink or folder; output=None only returns the figure"""
+    if output is not None:
+        _as_sink(output).save_figure(fig, name, **savefig_kwargs)
+    return fig
+
+def save_html(fig, output, name, **to_html_kwargs):
+    """Save a plotly figure to a sink or folder; output=None only returns the figure"""
+    if output is not None:
+        _as_sink(output).save_html(fig, name, **to_html_kwargs)
+    return fig
+
+def save_bytes(data, output, name):
+    """Save already encoded data (CSV, JSON, Parquet, ...) to a sink or folder"""
+    if output is not None:
+        _as_sink(output).write_bytes(name, data)
+    return data
@@ -1,9 +1,11 @@
 import pandas as pd
 import numpy as np
-import os
 import matplotlib.pyplot as plt
+from sinks import save_figure
+from cache import cached
 
-def rarefaction_curve(df, n_iter=100, step=1):
+def rarefaction_curve(df, n_iter=100, step=1, seed=None):
+    rng = np.random.default_rng(seed)
     genomes = df["Bin"].tolist()
     species_map = dict(zip(df["Bin"], df["Cluster"]))
     
@@ -14,7 +16,7 @@ def rarefaction_curve(df, n_iter=100, step=1):
     for depth in depths:
         species_counts = []
         for _ in range(n_iter):
-            subsample = np.random.choice(genomes, size=depth, replace=False)
+            subsample = rng.choice(genomes, size=depth, replace=False)
             clusters = set(species_map[g] for g in subsample)
             species_counts.append(len(clusters))
         results.append({
@@ -25,15 +27,16 @@ def rarefaction_curve(df, n_iter=100, step=1):
     
     return pd.DataFrame(results)
 
-def species_level_plot(drep, output_path):
+def species_level_plot(drep, output_path, n_iter=200, seed=0):
     df = drep.reset_index().loc[:,['genome', 'secondary_cluster']]
 
     df.rename(columns={'genome': 'Bin', 'secondary_cluster': 'Cluster'}, inplace=True)
 
-    results = rarefaction_curve(df, n_iter=200, step=1)
+    results = cached("rarefaction", [df], {"n_iter": n_iter, "step": 1, "seed": seed},
+                     lambda: rarefaction_curve(df, n_iter=n_iter, step=1, seed=seed))
 
 
-    plt.figure(figsize=(7,5))
+    fig = plt.figure(figsize=(7,5))
     plt.plot(results["depth"], results["mean_species"], label="Mean species richness", color="black")
     plt.fill_between(results["depth"],
                     results["mean_species"]-results["std_species"],
@@ -44,4 +47,4 @@ def species_level_plot(drep, output_path):
     plt.title("Species-level Rarefaction Curve")
     plt.legend()
 
-    plt.savefig(os.path.join(output_path, "species_level_rarefaction_curve.png"))
\ No newline at end of file
+    return save_figure(fig, output_path, "species_level_rarefaction_curve.png")
\ No newline at end of file
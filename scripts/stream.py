@@ -0,0 +1,133 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from sinks import save_bytes
+from rank_dist_plot import rank_counts, plot_rank_distribution
+from sanky_taxa import taxa_links, taxa_sankey
+from comp_conta_plot import completeness_contamination_density_plot
+from qc_summary import QuantileDigest, qc_metrics, checkm2_summary, merge_qc_summaries, plot_qc_summary
+
+class Histogram2D:
+    """Counts on a fixed grid; values outside the edges are dropped"""
+
+    def __init__(self, x_edges, y_edges):
+        self.x_edges = np.asarray(x_edges)
+        self.y_edges = np.asarray(y_edges)
+        self.counts = np.zeros((len(x_edges) - 1, len(y_edges) - 1), dtype=np.int64)
+
+    def update(self, x, y):
+        counts, _, _ = np.histogram2d(x, y, bins=[self.x_edges, self.y_edges])
+        self.counts += counts.astype(np.int64)
+        return self
+
+    def merge(self, other):
+        if not (np.allclose(self.x_edges, other.x_edges) and np.allclose(self.y_edges, other.y_edges)):
+            raise ValueError("Histograms use different bins")
+        self.counts += other.counts
+        return self
+
+class QualityAccumulator:
+    """
+    Completeness x contamination counts per MIMAG-like category as drawn by
+    completeness_contamination_plot, plus a digest of the contamination for its
+    0.995 quantile y-limit.
+    """
+
+    categories = ("partial", "medium", "high", "other")
+
+    def __init__(self):
+        self.x_edges = np.arange(40, 101, 1)
+        self.y_edges = np.arange(0, 7.05, 0.1)
+        self.histograms = {c: Histogram2D(self.x_edges, self.y_edges) for c in self.categories}
+        self.contamination = QuantileDigest()
+
+    def update(self, completeness, contamination):
+        df = pd.DataFrame({"x": pd.to_numeric(completeness, errors="coerce"),
+                           "y": pd.to_numeric(contamination, errors="coerce")}).dropna()
+        x, y = df["x"].to_numpy(), df["y"].to_numpy()
+
+        masks = {
+            "partial": x < 70,
+            "medium": (x >= 70) & (x < 90),
+            "high": (x >= 90) & (y <= 5),
+            "other": (x >= 90) & (y > 5),
+        }
+        for category, mask in masks.items():
+            self.histograms[category].update(x[mask], y[mask])
+        self.contamination.update(y)
+        return self
+
+    def merge(self, other):
+        for category in self.categories:
+            self.histograms[category].merge(other.histograms[category])
+        self.contamination.merge(other.contamination)
+        return self
+
+    def ymax(self):
+        return max(5.0, min(7.0, np.ceil(self.contamination.quantile(0.995))))
+
+def add_counts(total, counts):
+    """Sum of two value_counts Series, largest first"""
+    if total is None:
+        return counts
+    return total.add(counts, fill_value=0).astype(np.int64).sort_values(ascending=False, kind="stable")
+
+def add_links(total, links):
+    """Sum of two taxa_links tables, pairs in order of first appearance"""
+    if total is None:
+        return links
+    return (pd.concat([total, links]).groupby(["source", "target"], sort=False)["count"]
+            .sum().reset_index())
+
+def read_chunks(path, columns, chunk_size):
+    """Chunks of an index column plus the requested columns (those present in the file)"""
+    sep = "\t" if path.endswith(".tsv") or path.endswith(".tabular") else ","
+    header = pd.read_csv(path, sep=sep, nrows=0).columns
+    usecols = [header[0]] + [c for c in columns if c in header]
+    return pd.read_csv(path, sep=sep, index_col=0, usecols=usecols, chunksize=chunk_size)
+
+def stream_accumulators(gtdb_path, checkm_path, checkm2_path, rank, chunk_size=1_000_000):
+    """Read GTDB, CheckM and CheckM2 chunk by chunk into mergeable count / histogram accumulators"""
+    acc = {"rank_counts": None, "links": None, "quality": QualityAccumulator(), "qc": None}
+
+    n = 0
+    for chunk in read_chunks(gtdb_path, ["classification"], chunk_size):
+        chunk.index.name = "user_genome"
+        acc["rank_counts"] = add_counts(acc["rank_counts"], rank_counts(chunk, rank))
+        acc["links"] = add_links(acc["links"], taxa_links(chunk))
+        n += len(chunk)
+    print(f"[INFO] gtdb streamed: {n} rows")
+
+    n = 0
+    for chunk in read_chunks(checkm_path, ["Completeness", "Contamination"], chunk_size):
+        acc["quality"].update(chunk["Completeness"], chunk["Contamination"])
+        n += len(chunk)
+    print(f"[INFO] checkm streamed: {n} rows")
+
+    for chunk in read_chunks(checkm2_path, list(qc_metrics), chunk_size):
+        summary = checkm2_summary(chunk)
+        acc["qc"] = summary if acc["qc"] is None else merge_qc_summaries([acc["qc"], summary])
+    print(f"[INFO] checkm2 streamed: {acc['qc']['n_genomes']} rows")
+
+    return acc
+
+def stream_plots(gtdb_path, checkm_path, checkm2_path, output_path, rank, n,
+                 chunk_size=1_000_000, qc_summary=False, sankey_formats=("html",)):
+    """Pie, Sankey, completeness/contamination and CheckM2 histograms without loading the full tables"""
+    acc = stream_accumulators(gtdb_path, checkm_path, checkm2_path, rank, chunk_size)
+
+    plot_rank_distribution(acc["rank_counts"], output_path, rank, n)
+    taxa_sankey(acc["links"], output_path, sankey_formats)
+
+    quality = acc["quality"]
+    completeness_contamination_density_plot([quality.histograms[c].counts for c in quality.categories],
+                                            quality.x_edges, quality.y_edges, quality.ymax(), output_path)
+
+    location = getattr(output_path, "location", output_path)
+    acc["qc"]["runs"] = [os.path.basename(os.path.normpath(location))] if location else []
+    plot_qc_summary(acc["qc"], output_path)
+    if qc_summary:
+        save_bytes(json.dumps(acc["qc"]).encode("utf-8"), output_path, "qc_summary.json")
+
+    return acc